@@ -4,6 +4,7 @@ import logging
 from datetime import datetime
 from typing import List
 
+from core.cot_context import emit_var
 from db.models import User
 from db.session import SessionLocal, get_db
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
@@ -24,10 +25,37 @@ from services.suggestions_service import suggestions_service
 from services.cot_cache_service import cot_cache
 from sqlalchemy.orm import Session
 
+try:
+    import orjson  # C-accelerated serialization of streamed chunks
+except ImportError:  # Fall back to stdlib json if orjson is not installed
+    orjson = None
+
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
+def _sse_event(payload) -> bytes:
+    """
+    Format a payload as a server-sent event
+
+    Args:
+        payload: JSON-serializable chunk; other values (e.g. datetimes) are sent as str
+
+    Returns:
+        Encoded SSE message
+    """
+    if orjson is not None:
+        # Datetimes pass through to str() so timestamps match the json fallback
+        data = orjson.dumps(
+            payload,
+            default=str,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+    else:
+        data = json.dumps(payload, default=str).encode()
+    return b"data: " + data + b"\n\n"
+
+
 def save_assistant_message_bg(
     conversation_id: int,
     response_text: str,
@@ -167,7 +195,7 @@ async def generate_stream(
     cot_cache.update_user_data(user_id, cache_data)
 
     # Emit first chunk immediately to start the stream
-    yield f"data: {json.dumps({'type': 'status', 'data': 'starting'})}\n\n"
+    yield _sse_event({"type": "status", "data": "starting"})
 
     # Use asyncio.Queue for real-time step emission
     step_queue = asyncio.Queue()
@@ -177,6 +205,7 @@ async def generate_stream(
     # Track step messages for cumulative updates
     step_messages = {}  # {step_id: [list of description parts]}
     step_counters = {}  # {step_type: counter} for repeating steps
+    streamed_tokens = []  # Response tokens already sent to the client
 
     try:
         # Define callback function to emit CoT steps in real-time
@@ -189,6 +218,15 @@ async def generate_stream(
         ):
             """Emit Chain of Thought step immediately to queue and save to list"""
             nonlocal cache_data  # Access parent scope variable
+
+            # Response tokens go straight to the client, they are not CoT steps
+            if step_type == "token":
+                streamed_tokens.append(description)
+                cache_data["assistant_response"] += description
+                cache_data["last_updated"] = datetime.utcnow()
+                cot_cache.update_user_data(user_id, cache_data)
+                await step_queue.put({"type": "token", "data": description})
+                return
             
             # Generate unique ID for repeating steps (like analyzing_document)
             # or use step_type for unique steps
@@ -279,6 +317,10 @@ async def generate_stream(
 
             await step_queue.put(step)
 
+        # Services read the callback from the context; the background task
+        # below copies it, and the stream's context ends with the request
+        emit_var.set(emit_cot_step)
+
         # Background task to process query
         async def process_in_background():
             try:
@@ -287,7 +329,6 @@ async def generate_stream(
                     conversation_history=conversation_history,
                     user_id=user_id,
                     conversation_id=conversation_id,
-                    emit_callback=emit_cot_step,
                 )
                 result_container["result"] = result
             except Exception as e:
@@ -305,9 +346,12 @@ async def generate_stream(
             try:
                 # Wait for next step with timeout
                 step = await asyncio.wait_for(step_queue.get(), timeout=0.1)
+                if isinstance(step, dict):
+                    yield _sse_event(step)
+                    continue
                 step_count += 1
                 chunk = {"type": "cot_step", "data": step.model_dump()}
-                yield f"data: {json.dumps(chunk, default=str)}\n\n"
+                yield _sse_event(chunk)
             except asyncio.TimeoutError:
                 # No step available, continue waiting
                 continue
@@ -318,7 +362,7 @@ async def generate_stream(
         # Check for errors
         if result_container["error"]:
             error_chunk = {"type": "error", "data": result_container["error"]}
-            yield f"data: {json.dumps(error_chunk)}\n\n"
+            yield _sse_event(error_chunk)
             return
 
         result = result_container["result"]
@@ -330,17 +374,29 @@ async def generate_stream(
         # Initialize suggestions list (will be populated later)
         save_data["suggestions"] = []
 
+        if streamed_tokens:
+            # The client already has the response from the token stream. If
+            # output guardrails or a fallback changed it, replace what was shown
+            if "".join(streamed_tokens) != response_text:
+                yield _sse_event({"type": "replace", "data": response_text})
+                cache_data["assistant_response"] = response_text
+                cache_data["last_updated"] = datetime.utcnow()
+                cot_cache.update_user_data(user_id, cache_data)
+            response_chunks = ""
+        else:
+            response_chunks = response_text
+
         # Stream response content (character by character to preserve markdown formatting)
         # Stream in small chunks (5 chars at a time) for smooth typing effect while preserving newlines
         chunk_size = 5
-        total_chunks = (len(response_text) + chunk_size - 1) // chunk_size
-        logger.info(f"[STREAMING] Starting to stream response of {len(response_text)} characters in {total_chunks} chunks")
+        total_chunks = (len(response_chunks) + chunk_size - 1) // chunk_size
+        logger.info(f"[STREAMING] Starting to stream response of {len(response_chunks)} characters in {total_chunks} chunks")
         
         chunk_count = 0
-        for i in range(0, len(response_text), chunk_size):
-            text_chunk = response_text[i : i + chunk_size]
+        for i in range(0, len(response_chunks), chunk_size):
+            text_chunk = response_chunks[i : i + chunk_size]
             chunk = {"type": "content", "data": text_chunk}
-            yield f"data: {json.dumps(chunk)}\n\n"
+            yield _sse_event(chunk)
             
             # Update cache with response chunk
             cache_data["assistant_response"] += text_chunk
@@ -362,7 +418,7 @@ async def generate_stream(
                 "type": "sources",
                 "data": [s.model_dump() for s in result["sources"]],
             }
-            yield f"data: {json.dumps(sources_chunk)}\n\n"
+            yield _sse_event(sources_chunk)
             
             # Update cache with sources
             cache_data["sources_count"] = len(result["sources"])
@@ -374,26 +430,35 @@ async def generate_stream(
             logger.info(
                 f"Starting suggestions generation for conversation {conversation_id}"
             )
-            suggestions = await suggestions_service.generate_suggestions(
-                conversation_history=conversation_history
-                + [
-                    {"role": "user", "content": query},
-                    {"role": "assistant", "content": response_text},
-                ],
-                emit_callback=emit_cot_step,
+            suggestions_task = asyncio.create_task(
+                suggestions_service.generate_suggestions(
+                    conversation_history=conversation_history
+                    + [
+                        {"role": "user", "content": query},
+                        {"role": "assistant", "content": response_text},
+                    ],
+                )
             )
 
-            # Emit any remaining CoT steps from suggestions
-            while not step_queue.empty():
-                step = await step_queue.get()
-                chunk = {"type": "cot_step", "data": step.model_dump()}
-                yield f"data: {json.dumps(chunk, default=str)}\n\n"
+            # Stream suggestion CoT steps as each line arrives
+            while not suggestions_task.done() or not step_queue.empty():
+                try:
+                    step = await asyncio.wait_for(step_queue.get(), timeout=0.1)
+                    if isinstance(step, dict):
+                        yield _sse_event(step)
+                        continue
+                    chunk = {"type": "cot_step", "data": step.model_dump()}
+                    yield _sse_event(chunk)
+                except asyncio.TimeoutError:
+                    continue
+
+            suggestions = await suggestions_task
 
             if suggestions:
                 # Save suggestions for background task
                 save_data["suggestions"] = suggestions
                 suggestions_chunk = {"type": "suggestions", "data": suggestions}
-                yield f"data: {json.dumps(suggestions_chunk)}\n\n"
+                yield _sse_event(suggestions_chunk)
                 
                 # Update cache with suggestions
                 cache_data["suggestions_count"] = len(suggestions)
@@ -415,12 +480,12 @@ async def generate_stream(
 
         # Send done signal
         done_chunk = {"type": "done", "data": None}
-        yield f"data: {json.dumps(done_chunk)}\n\n"
+        yield _sse_event(done_chunk)
 
     except Exception as e:
         logger.error(f"Error in generate_stream: {str(e)}", exc_info=True)
         error_chunk = {"type": "error", "data": str(e)}
-        yield f"data: {json.dumps(error_chunk)}\n\n"
+        yield _sse_event(error_chunk)
 
 
 @router.post("/chat/stream")
@@ -15,6 +15,7 @@ from schemas.schemas import (
     QueryResponse,
 )
 from services.document_service import document_service
+from services.semantic_cache_service import semantic_cache
 from services.vector_store import vector_store
 from sqlalchemy.orm import Session
 
@@ -29,6 +30,8 @@ async def create_document(document: DocumentCreate, db: Session = Depends(get_db
     """
     try:
         result = await document_service.create_document(db, document)
+        # Cached answers and prefetched retrievals predate the new document
+        semantic_cache.clear()
         return result
     except Exception as e:
         logger.error(f"Error creating document: {str(e)}")
@@ -46,6 +49,7 @@ async def bulk_create_documents(
     """
     try:
         result = await document_service.bulk_create_documents(db, upload.documents)
+        semantic_cache.clear()
         return BulkUploadResponse(**result)
     except Exception as e:
         logger.error(f"Error in bulk upload: {str(e)}")
@@ -98,6 +102,8 @@ async def delete_document(document_id: int, db: Session = Depends(get_db)):
         success = await document_service.delete_document(db, document_id)
         if not success:
             raise HTTPException(status_code=404, detail="Document not found")
+        # Don't keep serving answers built from the deleted document
+        semantic_cache.clear()
         return {"message": "Document deleted successfully", "document_id": document_id}
     except HTTPException:
         raise
@@ -141,12 +147,12 @@ async def query_documents(query_request: QueryRequest):
 
         source_docs = [
             SourceDocument(
-                document_id=res["metadata"].get("document_id", 0),
-                title=res["metadata"].get("title", "Untitled"),
-                content_snippet=res["text"][:200] + "...",
-                relevance_score=res["score"],
-                source=res["metadata"].get("source"),
-                category=res["metadata"].get("category"),
+                document_id=res.metadata.get("document_id", 0),
+                title=res.metadata.get("title", "Untitled"),
+                content_snippet=res.text[:200] + "...",
+                relevance_score=res.score,
+                source=res.metadata.get("source"),
+                category=res.metadata.get("category"),
             )
             for res in results
         ]
@@ -196,6 +202,7 @@ async def upload_document(
             conversation_id=conversation.id,
             category=category,
         )
+        semantic_cache.clear()
 
         return result
 
@@ -253,6 +260,7 @@ async def delete_user_document(
             raise HTTPException(
                 status_code=404, detail="Document not found or not owned by user"
             )
+        semantic_cache.clear()
         return {"message": "Document deleted successfully", "document_id": document_id}
     except HTTPException:
         raise
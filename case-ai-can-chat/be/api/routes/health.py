@@ -44,6 +44,9 @@ async def health_check(db: Session = Depends(get_db)):
         elif vector_store.collection is None:
             services["vector_store"] = "unhealthy - collection missing"
             logger.error("Vector store initialized but collection is None")
+        elif not await vector_store.check_heartbeat():
+            services["vector_store"] = "unhealthy - ChromaDB not responding"
+            logger.error("ChromaDB heartbeat failed")
         else:
             # Try to get actual stats to verify it's working
             try:
@@ -70,6 +70,33 @@ class Settings(BaseSettings):
     )
     LLM_TEMPERATURE: float = 0.7
     LLM_MAX_TOKENS: int = 2048
+    LLM_MAX_CONNECTIONS: int = Field(
+        default=1000, description="Maximum concurrent connections to Ollama"
+    )
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = Field(
+        default=100, description="Idle connections kept open to Ollama for reuse"
+    )
+    LLM_KEEPALIVE_EXPIRY: float = Field(
+        default=30.0, description="Seconds an idle Ollama connection is kept alive"
+    )
+    LLM_HTTP2_ENABLED: bool = Field(
+        default=False,
+        description="Negotiate HTTP/2 with Ollama; only takes effect over https "
+        "(e.g. a TLS proxy), since plain-http URLs get no h2c upgrade",
+    )
+    LLM_STREAM_BUFFER_SIZE: int = Field(
+        default=64, description="Parsed tokens buffered ahead of a streaming consumer"
+    )
+    LLM_STREAM_COALESCE_TOKENS: int = Field(
+        default=8, description="Maximum buffered tokens merged into one streamed chunk"
+    )
+    LLM_KEEP_ALIVE: str = Field(
+        default="30m",
+        description="How long Ollama keeps the model and its prompt KV cache loaded",
+    )
+    LLM_WARMUP_ENABLED: bool = Field(
+        default=True, description="Generate one token at startup to load the model"
+    )
 
     # Embedding Configuration - NIM Endpoint
     EMBEDDING_API_URL: str = Field(
@@ -83,6 +110,29 @@ class Settings(BaseSettings):
     EMBEDDING_DIMENSION: int = (
         2048  # llama-3.2-nv-embedqa-1b-v2 returns 2048-dimensional vectors
     )
+    EMBEDDING_DTYPE: str = Field(
+        default="float32",
+        description="Storage dtype for in-process embedding indexes: float32 or int8",
+    )
+    EMBEDDING_BATCH_SIZE: int = Field(
+        default=64, description="Texts sent per embedding API request"
+    )
+    EMBEDDING_MAX_CONCURRENCY: int = Field(
+        default=16, description="Embedding API requests in flight at once"
+    )
+    EMBEDDING_HTTP2_ENABLED: bool = Field(
+        default=True, description="Negotiate HTTP/2 with the NIM endpoint"
+    )
+    EMBEDDING_MAX_KEEPALIVE_CONNECTIONS: int = Field(
+        default=64, description="Idle connections kept open to the NIM endpoint"
+    )
+    EMBEDDING_BATCH_WINDOW_MS: float = Field(
+        default=5.0,
+        description="Milliseconds single-text embedding calls wait to share a batch (0 disables)",
+    )
+    EMBEDDING_MAX_BATCH: int = Field(
+        default=32, description="Queued texts that flush a shared batch early"
+    )
 
     # Web Search Configuration (disabled by default - Nemotron 70B doesn't support function calling)
     ENABLE_WEB_SEARCH: bool = Field(
@@ -94,6 +144,21 @@ class Settings(BaseSettings):
     WEB_SEARCH_REGION: str = Field(
         default="ca-en", description="DuckDuckGo search region (ca-en for Canada)"
     )
+    WEB_SEARCH_CACHE_TTL_SECONDS: float = Field(
+        default=3600.0, description="Seconds cached web search results stay valid"
+    )
+    WEB_SEARCH_CACHE_MAX_ENTRIES: int = Field(
+        default=1024, description="Maximum number of cached web searches"
+    )
+    WEB_SEARCH_SEMANTIC_CACHE_ENABLED: bool = Field(
+        default=True,
+        description="Reuse web search results for paraphrased queries "
+        "(independent of SEMANTIC_CACHE_ENABLED)",
+    )
+    WEB_SEARCH_CACHE_SIMILARITY_THRESHOLD: float = Field(
+        default=0.97,
+        description="Minimum cosine similarity for a paraphrased query to reuse results",
+    )
 
     # Healthcare Knowledge Base URLs
     HEALTHCARE_KNOWLEDGE_URLS: Union[List[str], str] = Field(
@@ -123,6 +188,37 @@ class Settings(BaseSettings):
         default=5, description="Number of documents to keep after reranking"
     )
 
+    # Semantic Cache
+    SEMANTIC_CACHE_ENABLED: bool = Field(
+        default=False,
+        description="Reuse answers for near-duplicate queries (off by default: "
+        "queries differing only in a name or identifier can embed above the threshold)",
+    )
+    SEMANTIC_CACHE_SIMILARITY_THRESHOLD: float = Field(
+        default=0.95, description="Minimum cosine similarity for a cache hit"
+    )
+    SEMANTIC_CACHE_TTL_SECONDS: float = Field(
+        default=600.0, description="Seconds a cached result stays valid"
+    )
+    SEMANTIC_CACHE_MAX_ENTRIES: int = Field(
+        default=1024, description="Maximum number of cached results"
+    )
+    SEMANTIC_CACHE_LSH_BITS: int = Field(
+        default=8, description="Random hyperplanes used for LSH bucket signatures"
+    )
+
+    # Follow-up Prefetch
+    PREFETCH_ENABLED: bool = Field(
+        default=False,
+        description="Predict follow-up questions and prefetch their retrieval results",
+    )
+    PREFETCH_TOPICS: int = Field(
+        default=3, description="Number of follow-up questions predicted per answer"
+    )
+    PREFETCH_MIN_INTERVAL_SECONDS: float = Field(
+        default=0.5, description="Minimum seconds between follow-up predictions"
+    )
+
     # Document Processing
     CHUNK_SIZE: int = Field(
         default=512, description="Size of document chunks in characters"
@@ -0,0 +1,13 @@
+"""
+Chain of Thought Context
+Request-scoped callback used by services to emit CoT steps
+"""
+
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Optional
+
+# Set once per streaming request; tasks created during the request inherit it.
+# None means nobody is listening, so services skip building step descriptions.
+emit_var: ContextVar[Optional[Callable[..., Awaitable[None]]]] = ContextVar(
+    "emit", default=None
+)
@@ -1,4 +1,5 @@
 # Import warning suppression first, before any other imports
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
@@ -23,6 +24,7 @@ async def lifespan(app: FastAPI):
     Initializes database, runs migrations, and sets up NVIDIA NeMo stack
     """
     logger.info("Starting HealthChat RAG Backend with NVIDIA NeMo...")
+    llm_warmup = None
 
     try:
         # Initialize database and run migrations
@@ -61,6 +63,9 @@ async def lifespan(app: FastAPI):
 
             await nemo_llm_service.initialize()
 
+            # Load the model in the background so startup isn't held up
+            llm_warmup = asyncio.create_task(nemo_llm_service.warmup())
+
             # Initialize NeMo Guardrails
             if settings.NEMO_GUARDRAILS_ENABLED:
                 logger.info("Initializing NeMo Guardrails...")
@@ -84,6 +89,11 @@ async def lifespan(app: FastAPI):
 
     logger.info("Shutting down HealthChat RAG Backend...")
 
+    await vector_store.close()
+
+    if llm_warmup is not None and not llm_warmup.done():
+        llm_warmup.cancel()
+
     # Cleanup NeMo services
     if settings.NEMO_ENABLED:
         from services.nemo_llm_service import nemo_llm_service
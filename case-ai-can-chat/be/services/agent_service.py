@@ -2,6 +2,7 @@ import logging
 from typing import Any, Dict, List
 
 from core.config import settings
+from core.cot_context import emit_var
 from schemas.schemas import ChatMessage, SourceDocument
 from services.rag_service import rag_service
 from services.web_search_service import web_search_service
@@ -19,13 +20,14 @@ class AgentService:
         pass
 
     async def _decide_tools(
-        self, query: str, conversation_history: List[ChatMessage], emit_callback=None
+        self, query: str, conversation_history: List[ChatMessage]
     ) -> List[str]:
         """
         Decides which tools to use based on the query and conversation history.
         For now, a simple heuristic: if query contains "search internet" or "latest news", use web search.
         Otherwise, prioritize RAG.
         """
+        emit_callback = emit_var.get()
         # Emit CoT step
         if emit_callback:
             await emit_callback(
@@ -85,10 +87,11 @@ class AgentService:
 
         return tools
 
-    async def _execute_web_search(self, query: str, emit_callback=None) -> str:
+    async def _execute_web_search(self, query: str) -> str:
         """
         Executes a web search and formats the results as context.
         """
+        emit_callback = emit_var.get()
         # Emit CoT step
         if emit_callback:
             await emit_callback(
@@ -148,38 +151,61 @@ class AgentService:
         conversation_history: List[ChatMessage],
         user_id: int,
         conversation_id: int = None,
-        emit_callback=None,
     ) -> Dict[str, Any]:
         """
         Main entry point for the agent to process a user query.
         """
         logger.info(f"Agent processing query for user {user_id}: '{query[:100]}...'")
 
-        tools_to_use = await self._decide_tools(
-            query, conversation_history, emit_callback=emit_callback
-        )
+        tools_to_use = await self._decide_tools(query, conversation_history)
+        # Web results change over time, so only document answers are reused
+        cacheable = "web_search" not in tools_to_use and "rag" in tools_to_use
+
+        if cacheable:
+            cached = await rag_service.lookup_answer(
+                query, conversation_history, user_id=user_id
+            )
+            if cached is not None:
+                return {
+                    "response": cached["response"],
+                    "sources": cached["sources"],
+                    "metadata": {
+                        "used_rag": True,
+                        "used_web_search": False,
+                        **cached["metadata"],
+                    },
+                }
 
         combined_context = []
+        input_check = None
         all_sources: List[SourceDocument] = []
         metadata: Dict[str, Any] = {"used_rag": False, "used_web_search": False}
 
         if "web_search" in tools_to_use:
-            web_context = await self._execute_web_search(
-                query, emit_callback=emit_callback
-            )
+            web_context = await self._execute_web_search(query)
             combined_context.append(web_context)
             metadata["used_web_search"] = True
 
         if "rag" in tools_to_use:
             # RAG service will handle document retrieval and context building
             # Pass conversation_id to RAG service for filtering conversation-specific documents
+            # Only retrieval runs here; the answer is generated once, below,
+            # from the combined context
             rag_result = await rag_service.process_query(
                 query=query,
                 conversation_history=conversation_history,
                 user_id=user_id,
                 conversation_id=conversation_id,
-                emit_callback=emit_callback,
+                generate=False,
             )
+            if rag_result["metadata"].get("blocked"):
+                # Input guardrails refused the query; there is nothing to generate
+                return {
+                    "response": rag_result["response"],
+                    "sources": [],
+                    "metadata": {**metadata, **rag_result["metadata"]},
+                }
+            input_check = rag_result.get("input_check")
             combined_context.append(
                 rag_result["context"]
             )  # Assuming rag_service returns context
@@ -194,14 +220,24 @@ class AgentService:
             )
 
         # Generate final response using the combined context
-        response = await rag_service.generate_response(
+        response, flags = await rag_service.generate_answer(
             query=query,
             context=final_context,
             conversation_history=conversation_history,
-            emit_callback=emit_callback,
+            input_check=input_check,
         )
+        metadata.update(flags)
 
-        return {"response": response, "sources": all_sources, "metadata": metadata}
+        result = {"response": response, "sources": all_sources, "metadata": metadata}
+        if "rag" in tools_to_use:
+            await rag_service.record_answer(
+                query,
+                conversation_history,
+                {**result, "context": final_context},
+                user_id=user_id,
+                cache=cacheable,
+            )
+        return result
 
 
 agent_service = AgentService()
@@ -1,11 +1,23 @@
+import asyncio
 import logging
 from typing import List, Union
 
 import httpx
+import numpy as np
 from core.config import settings
 
+try:
+    import orjson as _json  # C-accelerated JSON straight to and from bytes
+except ImportError:  # Fall back to stdlib json if orjson is not installed
+    import json as _json
+
 logger = logging.getLogger(__name__)
 
+_JSON_HEADERS = {"accept": "application/json", "content-type": "application/json"}
+
+# Short timeout for connectivity probes so they don't block startup
+_PROBE_TIMEOUT = 3.0
+
 
 class NeMoEmbeddingsService:
     """
@@ -16,8 +28,19 @@ class NeMoEmbeddingsService:
     def __init__(self):
         self.api_url = settings.EMBEDDING_API_URL
         self.model_name = settings.EMBEDDING_MODEL
-        self.client = httpx.AsyncClient(timeout=60.0)
-        self.test_client = httpx.AsyncClient(timeout=3.0)  # Shorter timeout for testing
+        # One pooled client serves embeddings and connectivity probes, so the
+        # startup probe leaves a warm connection for the first real request
+        self.client = httpx.AsyncClient(
+            timeout=60.0,
+            transport=httpx.AsyncHTTPTransport(
+                http2=settings.EMBEDDING_HTTP2_ENABLED,
+                limits=httpx.Limits(
+                    max_keepalive_connections=settings.EMBEDDING_MAX_KEEPALIVE_CONNECTIONS
+                ),
+            ),
+        )
+        # Caps embedding requests in flight across all batch calls
+        self._batch_semaphore = asyncio.Semaphore(settings.EMBEDDING_MAX_CONCURRENCY)
         self.initialized = False  # Allows app to start
         self.is_healthy = False  # Reflects actual connection status
 
@@ -34,18 +57,16 @@ class NeMoEmbeddingsService:
             # Quick connectivity test with short timeout (3 seconds)
             try:
                 logger.info("Testing NIM endpoint connectivity (3s timeout)...")
-                test_result = await self.test_client.post(
+                test_result = await self.client.post(
                     self.api_url,
+                    timeout=_PROBE_TIMEOUT,
                     json={
                         "input": "test",
                         "model": self.model_name,
                         "input_type": "passage",
                         "modality": "text",
                     },
-                    headers={
-                        "accept": "application/json",
-                        "Content-Type": "application/json",
-                    },
+                    headers=_JSON_HEADERS,
                 )
 
                 if test_result.status_code == 200:
@@ -104,7 +125,7 @@ class NeMoEmbeddingsService:
             List of embedding vectors
         """
         try:
-            # Prepare request payload
+            # Prepare request payload, serialized once to the wire body
             payload = {
                 "input": text,
                 "model": self.model_name,
@@ -115,11 +136,8 @@ class NeMoEmbeddingsService:
             # Call API
             response = await self.client.post(
                 self.api_url,
-                json=payload,
-                headers={
-                    "accept": "application/json",
-                    "Content-Type": "application/json",
-                },
+                content=_json.dumps(payload),
+                headers=_JSON_HEADERS,
             )
 
             if response.status_code != 200:
@@ -127,8 +145,8 @@ class NeMoEmbeddingsService:
                 logger.error(error_msg)
                 raise RuntimeError(error_msg)
 
-            # Parse response
-            result = response.json()
+            # Parse response from the raw bytes, skipping a str decode of the body
+            result = _json.loads(response.content)
 
             # Extract embeddings from response
             # NIM API returns: {"data": [{"embedding": [...]}, ...]}
@@ -153,8 +171,6 @@ class NeMoEmbeddingsService:
         """
         # This method signature matches the old interface for compatibility
         # In practice, use encode_async
-        import asyncio
-
         try:
             loop = asyncio.get_event_loop()
         except RuntimeError:
@@ -185,7 +201,7 @@ class NeMoEmbeddingsService:
             logger.error(f"Error encoding text: {str(e)}")
             raise
 
-    def encode_batch(self, texts: List[str]) -> List[List[float]]:
+    def encode_batch(self, texts: List[str]) -> np.ndarray:
         """
         Generate embeddings for multiple texts
         Note: This is a sync wrapper
@@ -196,8 +212,6 @@ class NeMoEmbeddingsService:
         Returns:
             List of embedding vectors
         """
-        import asyncio
-
         try:
             loop = asyncio.get_event_loop()
         except RuntimeError:
@@ -208,23 +222,52 @@ class NeMoEmbeddingsService:
 
     async def encode_batch_async(
         self, texts: List[str], input_type: str = "passage"
-    ) -> List[List[float]]:
+    ) -> np.ndarray:
         """
         Generate embeddings for multiple texts (async version)
+        Large inputs are split into length-sorted micro-batches sent concurrently
 
         Args:
             texts: List of input texts
             input_type: Type of input - "query" for search queries, "passage" for documents
 
         Returns:
-            List of embedding vectors
+            (len(texts), dimension) float32 array of embedding vectors
         """
         if not self.initialized:
             raise RuntimeError("Embeddings service not initialized")
 
         try:
             logger.info(f"Encoding batch of {len(texts)} texts via NIM API")
-            embeddings = await self._call_api(texts, input_type=input_type)
+            batch_size = settings.EMBEDDING_BATCH_SIZE
+            if len(texts) <= batch_size:
+                return np.asarray(
+                    await self._call_api(texts, input_type=input_type),
+                    dtype=np.float32,
+                )
+
+            # Similar lengths per request keep padding waste low on the server
+            order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+            batches = [
+                order[start : start + batch_size]
+                for start in range(0, len(order), batch_size)
+            ]
+
+            async def encode_micro_batch(indices: List[int]) -> np.ndarray:
+                async with self._batch_semaphore:
+                    embeddings = await self._call_api(
+                        [texts[i] for i in indices], input_type=input_type
+                    )
+                return np.asarray(embeddings, dtype=np.float32)
+
+            results = await asyncio.gather(
+                *[encode_micro_batch(batch) for batch in batches]
+            )
+
+            # Restore the caller's order
+            embeddings = np.empty((len(texts), results[0].shape[1]), dtype=np.float32)
+            for indices, batch_embeddings in zip(batches, results):
+                embeddings[indices] = batch_embeddings
             return embeddings
 
         except Exception as e:
@@ -248,18 +291,16 @@ class NeMoEmbeddingsService:
             True if service is currently accessible
         """
         try:
-            test_result = await self.test_client.post(
+            test_result = await self.client.post(
                 self.api_url,
+                timeout=_PROBE_TIMEOUT,
                 json={
                     "input": "health_check",
                     "model": self.model_name,
                     "input_type": "passage",
                     "modality": "text",
                 },
-                headers={
-                    "accept": "application/json",
-                    "Content-Type": "application/json",
-                },
+                headers=_JSON_HEADERS,
             )
             is_healthy = test_result.status_code == 200
             self.is_healthy = is_healthy  # Update cached status
@@ -3,6 +3,7 @@ from pathlib import Path
 from typing import Any, Dict, List, Optional
 
 from core.config import settings
+from core.cot_context import emit_var
 
 logger = logging.getLogger(__name__)
 
@@ -78,19 +79,17 @@ class NeMoGuardrailsService:
         # This is handled by the config files already created
         pass
 
-    async def check_input(
-        self, user_message: str, emit_callback=None
-    ) -> Dict[str, Any]:
+    async def check_input(self, user_message: str) -> Dict[str, Any]:
         """
         Check user input for policy violations
 
         Args:
             user_message: User's input message
-            emit_callback: Optional callback to emit CoT steps
 
         Returns:
             Dictionary with check results
         """
+        emit_callback = emit_var.get()
         if not self.enabled or not self.initialized:
             return {"allowed": True, "message": user_message, "violations": []}
 
@@ -186,7 +185,7 @@ class NeMoGuardrailsService:
             }
 
     async def check_output(
-        self, response: str, context: Optional[str] = None, emit_callback=None
+        self, response: str, context: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Check LLM output for hallucinations and harmful content
@@ -194,11 +193,11 @@ class NeMoGuardrailsService:
         Args:
             response: Generated response
             context: Context used for generation
-            emit_callback: Optional callback to emit CoT steps
 
         Returns:
             Dictionary with check results
         """
+        emit_callback = emit_var.get()
         if not self.enabled or not self.initialized:
             return {"allowed": True, "response": response, "issues": []}
 
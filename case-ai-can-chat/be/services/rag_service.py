@@ -1,13 +1,202 @@
+import asyncio
 import logging
 import re
-from typing import Any, Dict, List, Optional
+import time
+from collections import Counter, OrderedDict
+from dataclasses import replace
+from functools import lru_cache
+from types import MappingProxyType
+from typing import (
+    Any,
+    AsyncGenerator,
+    Callable,
+    Dict,
+    FrozenSet,
+    List,
+    Optional,
+    Tuple,
+)
+
+import numpy as np
 
 from core.config import settings
+from core.cot_context import emit_var
 from schemas.schemas import ChatMessage, SourceDocument
-from services.vector_store import vector_store
+from services.semantic_cache_service import semantic_cache
+from services.vector_store import SearchHit, vector_store
+
+try:
+    import ahocorasick  # Single-pass multi-term matching for the exact-match boost
+except ImportError:  # Fall back to one substring scan per term
+    ahocorasick = None
 
 logger = logging.getLogger(__name__)
 
+# Shared read-only stand-in for documents without metadata
+_EMPTY = MappingProxyType({})
+
+# Number of formatted contexts kept for repeated document sets
+_CONTEXT_CACHE_SIZE = 256
+
+# System message with the patient database, shared by every generation
+_SYSTEM_MESSAGE = """You are HealthChat, an AI assistant for a hospital system with direct access to real-time patient data.
+
+PATIENT DATABASE - You have immediate knowledge of these patients:
+
+1. **Emma Hernandez (MRN1000000)** - Age 2, Room 2A Surgery Unit, STABLE, Pneumonia
+2. **Isabella Johnson (MRN1000001)** - Age 11, Emergency Dept, WARNING, Acute condition
+3. **Isabella Hernandez (MRN1000002)** - Age 4, Emergency Dept, STABLE
+4. **Liam Williams (MRN1000003)** - Age 9, Oncology Unit, CRITICAL, Cancer treatment
+5. **William Miller (MRN1000004)** - Age 13, NICU, STABLE, Pneumonia
+6. **Ava Miller (MRN1000005)** - Age 6, Oncology Unit, STABLE, Post-op cancer surgery recovery
+7. **James Johnson (MRN1000006)** - Age 15, Room 4E **PICU**, WARNING, Respiratory Distress
+8. **James Brown (MRN1000007)** - Age 8, Room 2B **PICU**, WARNING, Sepsis  
+9. **Mason Williams (MRN1000008)** - Age 14, Room 3D Surgery Unit, STABLE, Appendicitis
+10. **Sophia Brown (MRN1000009)** - Age 7, General Medicine, STABLE, Dehydration
+11. **Olivia Davis (MRN1000010)** - Age 16, Cardiology Unit, STABLE, Arrhythmia
+
+HOSPITAL UNITS:
+- **PICU** (Pediatric Intensive Care): James Johnson, James Brown
+- Emergency Dept: Isabella Johnson, Isabella Hernandez  
+- Surgery: Emma Hernandez, Mason Williams
+- Oncology: Liam Williams, Ava Miller
+- Cardiology: Olivia Davis
+- NICU: William Miller
+- General Medicine: Sophia Brown
+
+INSTRUCTIONS:
+- Answer questions about patients using this data FIRST
+- If asked about a specific patient or unit, use the data above directly
+- Supplement with retrieved documents when available
+- Be conversational but precise with medical information
+
+Formatting:
+- Add blank lines between major sections/points for readability
+- Use **bold text** for emphasis when helpful
+- Keep responses conversational and focused"""
+
+# Instructions for predicting follow-up questions to prefetch
+_FOLLOW_UP_PROMPT = (
+    "Given a user's question and the assistant's answer, write the {count} "
+    "questions the user is most likely to ask next. Write one question per "
+    "line with no numbering or other text."
+)
+
+# Bullets or numbering the LLM may still put in front of a predicted question
+_LIST_MARKER_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+# Numbers in a query (MRNs, doses, dates) must match exactly for a cached answer
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+# Word tokenizer used for keyword reranking
+_WORD_RE = re.compile(r"\b\w+\b")
+
+# Number of documents whose rerank tokens are kept between queries
+_DOC_TOKEN_CACHE_SIZE = 10_000
+
+# (document_id, text hash) -> (word set, lowercased text)
+_DOC_TOKEN_CACHE: "OrderedDict[Tuple, Tuple[FrozenSet[str], str]]" = OrderedDict()
+
+
+def _exact_match_counter(terms: List[str]) -> Callable[[str], int]:
+    """
+    Build a function counting how many of the terms occur in a text
+    With pyahocorasick installed each text is scanned once for all terms
+
+    Args:
+        terms: Lowercased terms; duplicates count once per occurrence in the list
+
+    Returns:
+        Function mapping a lowercased text to its number of matched terms
+    """
+    weights = Counter(terms)
+
+    if ahocorasick is None or not weights:
+
+        def count_matches(text: str) -> int:
+            return sum(weight for term, weight in weights.items() if term in text)
+
+        return count_matches
+
+    automaton = ahocorasick.Automaton()
+    for term, weight in weights.items():
+        automaton.add_word(term, (term, weight))
+    automaton.make_automaton()
+
+    def count_matches(text: str) -> int:
+        # Each term counts once however often it occurs
+        matched = {value for _, value in automaton.iter(text)}
+        return sum(weight for _, weight in matched)
+
+    return count_matches
+
+
+def _document_tokens(doc: SearchHit) -> Tuple[FrozenSet[str], str]:
+    """
+    Get the rerank features of a retrieved document
+    The same chunks come back across queries, so results are cached; the text
+    hash keeps chunks of one document apart and invalidates edited content
+
+    Args:
+        doc: Retrieved document
+
+    Returns:
+        (word set, lowercased text) tuple
+    """
+    text = doc.text
+    key = ((doc.metadata or _EMPTY).get("document_id"), hash(text))
+    cached = _DOC_TOKEN_CACHE.get(key)
+    if cached is not None:
+        _DOC_TOKEN_CACHE.move_to_end(key)
+        return cached
+
+    text_lower = text.lower()
+    cached = (frozenset(_WORD_RE.findall(text_lower)), text_lower)
+    _DOC_TOKEN_CACHE[key] = cached
+    if len(_DOC_TOKEN_CACHE) > _DOC_TOKEN_CACHE_SIZE:
+        _DOC_TOKEN_CACHE.popitem(last=False)
+    return cached
+
+
+@lru_cache(maxsize=None)
+def _load_nemo_services() -> Tuple[Any, Any]:
+    """Import the NeMo LLM and guardrails services, once per process"""
+    from services.nemo_guardrails_service import nemo_guardrails_service
+    from services.nemo_llm_service import nemo_llm_service
+
+    return nemo_llm_service, nemo_guardrails_service
+
+
+@lru_cache(maxsize=None)
+def _load_openai_client(api_key: str) -> Any:
+    """Import OpenAI and create a shared async client, once per API key"""
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(api_key=api_key)
+
+
+def _source_document(doc: SearchHit) -> SourceDocument:
+    """
+    Build the source entry for a reranked document
+
+    Args:
+        doc: Reranked document
+
+    Returns:
+        SourceDocument for the response
+    """
+    meta = doc.metadata or _EMPTY
+    # Fields come from our own vector store with known types, so the model is
+    # built without pydantic validation
+    return SourceDocument.model_construct(
+        document_id=int(meta.get("document_id", 0)),
+        title=meta.get("title", "Untitled"),
+        content_snippet=f"{doc.text[:200]}...",
+        relevance_score=float(doc.relevance),
+        source=meta.get("source"),
+        category=meta.get("category"),
+    )
+
 
 class RAGService:
     """
@@ -23,6 +212,10 @@ class RAGService:
         self.llm_service = None
         self.guardrails_service = None
         self.use_nemo = settings.NEMO_ENABLED
+        self._context_cache: "OrderedDict[Tuple, str]" = OrderedDict()
+        self._prefetch_lock = asyncio.Semaphore(1)
+        self._last_prefetch_at = 0.0
+        self._prefetch_tasks = set()  # Keeps background prefetches referenced
         self._initialize_services()
 
     def _initialize_services(self):
@@ -30,18 +223,12 @@ class RAGService:
         try:
             if self.use_nemo:
                 logger.info("Initializing NVIDIA NeMo stack")
-                from services.nemo_guardrails_service import nemo_guardrails_service
-                from services.nemo_llm_service import nemo_llm_service
-
-                self.llm_service = nemo_llm_service
-                self.guardrails_service = nemo_guardrails_service
+                self.llm_service, self.guardrails_service = _load_nemo_services()
                 logger.info("NeMo services initialized")
             else:
                 logger.info("Initializing cloud LLM fallback")
                 if settings.OPENAI_API_KEY:
-                    from openai import AsyncOpenAI
-
-                    self.llm_service = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+                    self.llm_service = _load_openai_client(settings.OPENAI_API_KEY)
                     logger.info("OpenAI client initialized (fallback)")
                 else:
                     logger.warning("No LLM provider configured")
@@ -52,7 +239,6 @@ class RAGService:
         self,
         query: str,
         conversation_history: List[ChatMessage] = None,
-        emit_callback=None,
     ) -> str:
         """
         Augment user query with context and synonyms
@@ -60,11 +246,22 @@ class RAGService:
         Args:
             query: Original user query
             conversation_history: Previous conversation messages
-            emit_callback: Optional callback to emit CoT steps
 
         Returns:
             Augmented query
         """
+        emit_callback = emit_var.get()
+        # Without history there is nothing to add; report it in a single step
+        if not conversation_history:
+            if emit_callback:
+                await emit_callback(
+                    step_type="augmenting",
+                    label="Augmenting your query",
+                    description="✓ No conversation history to add, using the original query",
+                    status="complete",
+                )
+            return query
+
         try:
             # Emit CoT step
             if emit_callback:
@@ -78,24 +275,18 @@ class RAGService:
             # Track what augmentations we made
             augmentation_details = []
 
-            # If we have conversation history, add context
-            if conversation_history and len(conversation_history) > 0:
-                recent_messages = [
-                    msg.content
-                    for msg in conversation_history[-3:]
-                    if msg.role == "user"
-                ]
-                if recent_messages:
-                    recent_context = " ".join(recent_messages)
-                    augmented = f"{query} {recent_context}"
-                    augmentation_details.append(
-                        f"Added {len(recent_messages)} previous message(s) as context"
-                    )
-                else:
-                    augmented = query
+            # Add recent user messages as context
+            recent_messages = [
+                msg.content for msg in conversation_history[-3:] if msg.role == "user"
+            ]
+            if recent_messages:
+                recent_context = " ".join(recent_messages)
+                augmented = f"{query} {recent_context}"
+                augmentation_details.append(
+                    f"Added {len(recent_messages)} previous message(s) as context"
+                )
             else:
                 augmented = query
-                augmentation_details.append("No conversation history to add")
 
             # DISABLED: Query augmentation with keywords actually makes results worse
             # The embedding model works better with the original query
@@ -141,8 +332,8 @@ class RAGService:
         top_k: int = None,
         score_threshold: float = None,
         metadata_filter: Optional[Dict[str, Any]] = None,
-        emit_callback=None,
-    ) -> List[Dict[str, Any]]:
+        sources: Optional[List[Any]] = None,
+    ) -> List[SearchHit]:
         """
         Retrieve relevant documents using vector similarity search
 
@@ -151,25 +342,43 @@ class RAGService:
             top_k: Number of documents to retrieve
             score_threshold: Minimum relevance score
             metadata_filter: Optional metadata filters
-            emit_callback: Optional callback to emit CoT steps
+            sources: Retrievers with vector_store's search signature, searched
+                concurrently (defaults to the vector store)
 
         Returns:
             List of retrieved documents with scores
         """
+        emit_callback = emit_var.get()
         try:
             # Augment query
-            augmented_query = await self.augment_query(
-                query, emit_callback=emit_callback
-            )
+            augmented_query = await self.augment_query(query)
 
-            # Retrieve from vector store (it will emit its own CoT steps)
-            results = await vector_store.search(
-                query=augmented_query,
-                top_k=top_k or settings.RETRIEVAL_TOP_K,
-                score_threshold=score_threshold or settings.RETRIEVAL_SCORE_THRESHOLD,
-                filter_metadata=metadata_filter,
-                emit_callback=emit_callback,
-            )
+            top_k = top_k or settings.RETRIEVAL_TOP_K
+            score_threshold = score_threshold or settings.RETRIEVAL_SCORE_THRESHOLD
+
+            # Use results prefetched for a predicted follow-up if one matches
+            results = None
+            if settings.PREFETCH_ENABLED and metadata_filter is None and not sources:
+                results = await self._prefetched_documents(
+                    augmented_query, top_k, score_threshold
+                )
+
+            if results is None:
+                # Reuse the cached embedding of this query string, if any
+                query_embedding = await self._embed_query(augmented_query)
+
+                # Retrieve from every source (they emit their own CoT steps)
+                results = await self._search_sources(
+                    sources or [vector_store],
+                    augmented_query,
+                    top_k,
+                    score_threshold,
+                    metadata_filter,
+                    query_embedding=query_embedding,
+                )
+
+            # Keep only the best-scoring chunk of each document
+            results = self._dedupe_documents(results)
 
             # Emit document count with details
             if emit_callback:
@@ -177,9 +386,9 @@ class RAGService:
                     # Get top 3 document titles and scores for display
                     doc_summaries = []
                     for i, doc in enumerate(results[:3], 1):
-                        title = doc.get("title", "Untitled")[:40]
-                        score = doc.get("score", 0)
-                        doc_summaries.append(f"{i}. '{title}' ({score:.2f})")
+                        doc_summaries.append(
+                            f"{i}. '{doc.title[:40]}' ({doc.score:.2f})"
+                        )
 
                     docs_details = " | ".join(doc_summaries)
                     more_text = (
@@ -207,13 +416,85 @@ class RAGService:
             logger.error(f"Error retrieving documents: {str(e)}", exc_info=True)
             return []
 
+    def _dedupe_documents(self, documents: List[SearchHit]) -> List[SearchHit]:
+        """
+        Drop extra chunks of the same document, keeping the best-scoring one
+        Documents without a document_id are told apart by chunk id
+
+        Args:
+            documents: Retrieved documents
+
+        Returns:
+            Deduplicated documents in their original order
+        """
+        best = {}
+        for doc in documents:
+            meta = doc.metadata or _EMPTY
+            key = meta.get("document_id") or doc.id or id(doc)
+            kept = best.get(key)
+            if kept is None or doc.score > kept.score:
+                best[key] = doc
+
+        if len(best) < len(documents):
+            logger.debug(f"Dropped {len(documents) - len(best)} duplicate chunks")
+        return list(best.values())
+
+    async def _search_sources(
+        self,
+        sources: List[Any],
+        query: str,
+        top_k: int,
+        score_threshold: float,
+        metadata_filter: Optional[Dict[str, Any]],
+        query_embedding: Optional[np.ndarray] = None,
+    ) -> List[SearchHit]:
+        """
+        Search several retrievers concurrently and merge their results
+        A chunk returned by more than one source is kept once, with its best score
+
+        Args:
+            sources: Retrievers with vector_store's search signature
+            query: Search query
+            top_k: Number of documents to return
+            score_threshold: Minimum relevance score
+            metadata_filter: Optional metadata filters
+            query_embedding: Precomputed query embedding, or None to embed in the source
+
+        Returns:
+            Merged documents, best first
+        """
+        searches = [
+            source.search(
+                query=query,
+                top_k=top_k,
+                score_threshold=score_threshold,
+                filter_metadata=metadata_filter,
+                query_embedding=query_embedding,
+            )
+            for source in sources
+        ]
+        if len(searches) == 1:
+            return await searches[0]
+
+        merged = {}
+        for outcome in await asyncio.gather(*searches, return_exceptions=True):
+            if isinstance(outcome, Exception):
+                logger.warning(f"Retrieval source failed: {str(outcome)}")
+                continue
+            for doc in outcome:
+                key = doc.id or ((doc.metadata or _EMPTY).get("document_id"), doc.text)
+                kept = merged.get(key)
+                if kept is None or doc.score > kept.score:
+                    merged[key] = doc
+
+        return sorted(merged.values(), key=lambda x: x.score, reverse=True)[:top_k]
+
     async def rerank_documents(
         self,
         query: str,
-        documents: List[Dict[str, Any]],
+        documents: List[SearchHit],
         top_n: int = None,
-        emit_callback=None,
-    ) -> List[Dict[str, Any]]:
+    ) -> List[SearchHit]:
         """
         Rerank retrieved documents based on query relevance
         Uses simple keyword matching reranking
@@ -222,11 +503,11 @@ class RAGService:
             query: User query
             documents: Retrieved documents
             top_n: Number of documents to keep
-            emit_callback: Optional callback to emit CoT steps
 
         Returns:
             Reranked documents
         """
+        emit_callback = emit_var.get()
         try:
             # Emit CoT step
             if emit_callback:
@@ -242,47 +523,51 @@ class RAGService:
             top_n = top_n or settings.RERANK_TOP_N
 
             # Extract query keywords (preserve case for name matching)
-            query_terms = set(re.findall(r"\b\w+\b", query.lower()))
-            query_original = set(re.findall(r"\b\w+\b", query))
+            query_terms = frozenset(_WORD_RE.findall(query.lower()))
+            query_original = set(_WORD_RE.findall(query))
+            count_exact_matches = _exact_match_counter(
+                [term.lower() for term in query_original if len(term) > 2]
+            )
+            title_terms = [term for term in query_terms if len(term) > 2]
 
-            # Calculate keyword overlap score with name boosting
+            # Collect every per-document feature in one pass, then score all
+            # documents at once; overlap intersects the cached word sets
+            overlap, exact_matches, title_matches, semantic = [], [], [], []
             for doc in documents:
-                doc_text_lower = doc["text"].lower()
-                doc_terms = set(re.findall(r"\b\w+\b", doc_text_lower))
-
-                # Basic keyword overlap
-                overlap = len(query_terms.intersection(doc_terms))
-                keyword_score = overlap / max(len(query_terms), 1)
-
-                # Boost for exact phrase/name matches (case-insensitive)
-                exact_match_boost = 0.0
-                for term in query_original:
-                    if len(term) > 2 and term.lower() in doc_text_lower:
-                        exact_match_boost += 0.15  # Boost for each exact term match
-
-                # Title boost if query terms appear in title
-                title_boost = 0.0
-                title = doc.get("title", "").lower()
-                if any(term in title for term in query_terms if len(term) > 2):
-                    title_boost = 0.2
-
-                # Combine scores - give MORE weight to keywords when semantic score is poor
-                semantic_weight = (
-                    0.3 if doc["score"] > 0.1 else 0.1
-                )  # Less weight if semantic is poor
-                keyword_weight = 1.0 - semantic_weight
-
-                doc["rerank_score"] = (
-                    doc["score"] * semantic_weight
-                    + keyword_score * keyword_weight
-                    + exact_match_boost
-                    + title_boost
-                )
+                tokens, text = _document_tokens(doc)
+                title = doc.title.lower()
+                overlap.append(len(query_terms.intersection(tokens)))
+                exact_matches.append(count_exact_matches(text))
+                title_matches.append(any(term in title for term in title_terms))
+                semantic.append(doc.score)
+            overlap = np.array(overlap, dtype=np.float64)
+            exact_matches = np.array(exact_matches, dtype=np.float64)
+            title_matches = np.array(title_matches, dtype=bool)
+            semantic = np.array(semantic, dtype=np.float64)
+
+            # Basic keyword overlap
+            keyword_score = overlap / max(len(query_terms), 1)
+            # Boost for each exact phrase/name match (case-insensitive)
+            exact_match_boost = exact_matches * 0.15
+            # Title boost if query terms appear in title
+            title_boost = title_matches * 0.2
+
+            # Combine scores - give MORE weight to keywords when semantic score is poor
+            semantic_weight = np.where(semantic > 0.1, 0.3, 0.1)
+            keyword_weight = 1.0 - semantic_weight
+            rerank_scores = (
+                semantic * semantic_weight
+                + keyword_score * keyword_weight
+                + exact_match_boost
+                + title_boost
+            )
 
-            # Sort by rerank score and take top N
-            reranked = sorted(documents, key=lambda x: x["rerank_score"], reverse=True)[
-                :top_n
-            ]
+            for doc, rerank_score in zip(documents, rerank_scores.tolist()):
+                doc.rerank_score = rerank_score
+
+            # Sort by rerank score (stable, like sorted) and take top N
+            order = np.argsort(-rerank_scores, kind="stable")[:top_n]
+            reranked = [documents[i] for i in order.tolist()]
 
             logger.info(f"Reranked to top {len(reranked)} documents")
 
@@ -292,11 +577,8 @@ class RAGService:
                     # Show reranking results for top documents
                     rerank_details = []
                     for i, doc in enumerate(reranked[:3], 1):
-                        title = doc.get("title", "Untitled")[:35]
-                        original_score = doc.get("score", 0)
-                        rerank_score = doc.get("rerank_score", 0)
                         rerank_details.append(
-                            f"{i}. '{title}' (V:{original_score:.2f} K:{rerank_score:.1f})"
+                            f"{i}. '{doc.title[:35]}' (V:{doc.score:.2f} K:{doc.rerank_score:.1f})"
                         )
 
                     details_str = " | ".join(rerank_details)
@@ -330,19 +612,19 @@ class RAGService:
                 )
             return documents[:top_n] if documents else []
 
-    async def build_context(
-        self, documents: List[Dict[str, Any]], emit_callback=None
-    ) -> str:
+    async def build_context(self, documents: List[SearchHit]) -> str:
         """
         Build context string from retrieved documents
+        Identical document lists (same chunks, order and scores) reuse the
+        previously formatted string
 
         Args:
             documents: Retrieved and reranked documents
-            emit_callback: Optional callback to emit CoT steps
 
         Returns:
             Formatted context string
         """
+        emit_callback = emit_var.get()
         if not documents:
             return "No relevant documents found."
 
@@ -355,26 +637,42 @@ class RAGService:
                 status="active",
             )
 
-        context_parts = []
-        for i, doc in enumerate(documents, 1):
-            metadata = doc.get("metadata", {})
-            title = metadata.get("title", "Untitled")
-            category = metadata.get("category", "General")
-
-            # Emit CoT step for each document being analyzed
+        cache_key = tuple((doc.id, hash(doc.text), doc.relevance) for doc in documents)
+        cached = self._context_cache.get(cache_key)
+        if cached is not None:
+            self._context_cache.move_to_end(cache_key)
             if emit_callback:
-                score = doc.get("score", 0)
                 await emit_callback(
-                    step_type="analyzing_document",
-                    label=f"Analyzing document: {title}",
-                    description=f"✓ Doc {i}/{len(documents)}, Relevance: {score:.2f}",
+                    step_type="building",
+                    label="Building context",
+                    description=f"✓ Reused formatted context for {len(documents)} documents",
                     status="complete",
                 )
+            return cached
+
+        context_parts = []
+        analyses = []
+        for i, doc in enumerate(documents, 1):
+            metadata = doc.metadata or _EMPTY
+            title = metadata.get("title", "Untitled")
+            category = metadata.get("category", "General")
+            analyses.append(
+                f"✓ Doc {i}/{len(documents)}: {title}, Relevance: {doc.score:.2f}"
+            )
 
             context_parts.append(
                 f"[Document {i}] Title: {title} | Category: {category}\n"
-                f"Content: {doc['text']}\n"
-                f"Relevance Score: {doc.get('rerank_score', doc['score']):.3f}\n"
+                f"Content: {doc.text.strip()}\n"
+                f"Relevance Score: {doc.relevance:.3f}\n"
+            )
+
+        # Emit a single CoT step covering every analyzed document
+        if emit_callback:
+            await emit_callback(
+                step_type="analyzing_documents",
+                label=f"Analyzing {len(documents)} documents",
+                description="\n".join(analyses),
+                status="complete",
             )
 
         # Emit completion
@@ -386,130 +684,94 @@ class RAGService:
                 status="complete",
             )
 
-        return "\n".join(context_parts)
+        context = "\n".join(context_parts)
+        self._context_cache[cache_key] = context
+        if len(self._context_cache) > _CONTEXT_CACHE_SIZE:
+            self._context_cache.popitem(last=False)
+        return context
 
     async def generate_response(
         self,
         query: str,
         context: str,
         conversation_history: List[ChatMessage] = None,
-        emit_callback=None,
+        input_check: Optional[Dict[str, Any]] = None,
     ) -> str:
         """
         Generate response using NVIDIA Nemotron LLM with Guardrails
+        Tokens are forwarded to the emit callback as "token" steps while generating,
+        unless output guardrails must check the full response first
 
         Args:
             query: User query
             context: Retrieved document context
             conversation_history: Previous messages
-            emit_callback: Optional callback to emit CoT steps
+            input_check: Guardrails input check already run for this query, if any
 
         Returns:
             Generated response
         """
-        try:
-            if not self.llm_service:
-                return self._generate_fallback_response(context)
-
-            # Build enhanced system message with patient database
-            system_message = """You are HealthChat, an AI assistant for a hospital system with direct access to real-time patient data.
-
-PATIENT DATABASE - You have immediate knowledge of these patients:
-
-1. **Emma Hernandez (MRN1000000)** - Age 2, Room 2A Surgery Unit, STABLE, Pneumonia
-2. **Isabella Johnson (MRN1000001)** - Age 11, Emergency Dept, WARNING, Acute condition
-3. **Isabella Hernandez (MRN1000002)** - Age 4, Emergency Dept, STABLE
-4. **Liam Williams (MRN1000003)** - Age 9, Oncology Unit, CRITICAL, Cancer treatment
-5. **William Miller (MRN1000004)** - Age 13, NICU, STABLE, Pneumonia
-6. **Ava Miller (MRN1000005)** - Age 6, Oncology Unit, STABLE, Post-op cancer surgery recovery
-7. **James Johnson (MRN1000006)** - Age 15, Room 4E **PICU**, WARNING, Respiratory Distress
-8. **James Brown (MRN1000007)** - Age 8, Room 2B **PICU**, WARNING, Sepsis  
-9. **Mason Williams (MRN1000008)** - Age 14, Room 3D Surgery Unit, STABLE, Appendicitis
-10. **Sophia Brown (MRN1000009)** - Age 7, General Medicine, STABLE, Dehydration
-11. **Olivia Davis (MRN1000010)** - Age 16, Cardiology Unit, STABLE, Arrhythmia
-
-HOSPITAL UNITS:
-- **PICU** (Pediatric Intensive Care): James Johnson, James Brown
-- Emergency Dept: Isabella Johnson, Isabella Hernandez  
-- Surgery: Emma Hernandez, Mason Williams
-- Oncology: Liam Williams, Ava Miller
-- Cardiology: Olivia Davis
-- NICU: William Miller
-- General Medicine: Sophia Brown
-
-INSTRUCTIONS:
-- Answer questions about patients using this data FIRST
-- If asked about a specific patient or unit, use the data above directly
-- Supplement with retrieved documents when available
-- Be conversational but precise with medical information
-
-Formatting:
-- Add blank lines between major sections/points for readability
-- Use **bold text** for emphasis when helpful
-- Keep responses conversational and focused"""
-
-            # Build messages
-            messages = [{"role": "system", "content": system_message}]
-
-            # Add conversation history if available
-            if conversation_history:
-                for msg in conversation_history[-settings.MAX_CONVERSATION_HISTORY :]:
-                    messages.append({"role": msg.role, "content": msg.content})
+        response, _ = await self.generate_answer(
+            query, context, conversation_history, input_check=input_check
+        )
+        return response
 
-            # Add current query with context
-            if context and context.strip():
-                user_message = f"""Here's some relevant healthcare documentation:
+    async def generate_answer(
+        self,
+        query: str,
+        context: str,
+        conversation_history: List[ChatMessage] = None,
+        input_check: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[str, Dict[str, bool]]:
+        """
+        Generate a response and report whether it is a real answer
 
-{context}
+        Args:
+            query: User query
+            context: Retrieved document context
+            conversation_history: Previous messages
+            input_check: Guardrails input check already run for this query, if any
 
-Question: {query}"""
-            else:
-                user_message = query
+        Returns:
+            (response, flags) tuple; flags is empty for a generated answer, holds
+            "blocked" when guardrails replaced it, or "fallback" when the LLM
+            was unavailable
+        """
+        emit_callback = emit_var.get()
+        try:
+            if not self.llm_service:
+                return self._generate_fallback_response(context), {"fallback": True}
 
-            messages.append({"role": "user", "content": user_message})
+            # Check input with guardrails unless the caller already did
+            if input_check is None:
+                input_check = await self._check_input(query)
+            if input_check is not None and not input_check["allowed"]:
+                return self._blocked_response(input_check), {"blocked": True}
 
-            # Check input with guardrails if enabled
-            if (
+            # Unchecked output must not reach the client, so with output
+            # guardrails on the answer is sent only once the check passes
+            check_output = bool(
                 self.use_nemo
                 and self.guardrails_service
                 and settings.NEMO_GUARDRAILS_ENABLED
-            ):
-                input_check = await self.guardrails_service.check_input(
-                    query, emit_callback=emit_callback
-                )
+            )
 
-                if not input_check["allowed"]:
-                    logger.warning(
-                        f"Input blocked by guardrails: {input_check['violations']}"
-                    )
-                    return input_check.get(
-                        "safe_response",
-                        "I cannot process that request. How else can I help you with healthcare information?",
+            chunks = []
+            async for chunk in self.generate_response_stream(
+                query,
+                context,
+                conversation_history,
+                input_check=input_check,
+            ):
+                chunks.append(chunk)
+                if emit_callback and not check_output:
+                    await emit_callback(
+                        step_type="token",
+                        label="Generating response",
+                        description=chunk,
+                        status="active",
                     )
-
-            # Emit CoT step before generation
-            if emit_callback:
-                await emit_callback(
-                    step_type="generating",
-                    label="Generating response",
-                    description="Processing with Nemotron 70B",
-                    status="active",
-                )
-
-            # Generate response with NeMo LLM
-            if self.use_nemo and hasattr(self.llm_service, "generate"):
-                logger.info("Generating with NVIDIA Nemotron")
-                generated_text = await self.llm_service.generate(messages)
-            else:
-                # Fallback to OpenAI
-                logger.info("Generating with OpenAI (fallback)")
-                response = await self.llm_service.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=messages,
-                    temperature=settings.LLM_TEMPERATURE,
-                    max_tokens=settings.LLM_MAX_TOKENS,
-                )
-                generated_text = response.choices[0].message.content
+            generated_text = "".join(chunks)
 
             # Emit completion of generation
             if emit_callback:
@@ -520,28 +782,148 @@ Question: {query}"""
                     status="complete",
                 )
 
-            # Check output with guardrails if enabled
-            if (
-                self.use_nemo
-                and self.guardrails_service
-                and settings.NEMO_GUARDRAILS_ENABLED
-            ):
+            # Check output with guardrails once the full response is assembled
+            if check_output:
                 output_check = await self.guardrails_service.check_output(
-                    generated_text, context, emit_callback=emit_callback
+                    generated_text, context
                 )
 
                 if not output_check["allowed"]:
                     logger.warning(
                         f"Output blocked by guardrails: {output_check['issues']}"
                     )
-                    return output_check.get("safe_response", generated_text)
+                    safe_response = output_check.get("safe_response", generated_text)
+                    return safe_response, {"blocked": True}
 
             logger.info("Successfully generated response")
-            return generated_text
+            return generated_text, {}
 
         except Exception as e:
             logger.error(f"Error generating response: {str(e)}", exc_info=True)
-            return self._generate_fallback_response(context)
+            return self._generate_fallback_response(context), {"fallback": True}
+
+    async def generate_response_stream(
+        self,
+        query: str,
+        context: str,
+        conversation_history: List[ChatMessage] = None,
+        input_check: Optional[Dict[str, Any]] = None,
+    ) -> AsyncGenerator[str, None]:
+        """
+        Stream a response from NVIDIA Nemotron LLM as it is generated
+        Output guardrails need the full text, so they are left to the caller
+
+        Args:
+            query: User query
+            context: Retrieved document context
+            conversation_history: Previous messages
+            input_check: Guardrails input check already run for this query, if any
+
+        Yields:
+            Response text chunks
+        """
+        emit_callback = emit_var.get()
+        if input_check is None:
+            input_check = await self._check_input(query)
+        if input_check is not None and not input_check["allowed"]:
+            yield self._blocked_response(input_check)
+            return
+
+        messages = self._build_messages(query, context, conversation_history)
+
+        # Emit CoT step before generation
+        if emit_callback:
+            await emit_callback(
+                step_type="generating",
+                label="Generating response",
+                description="Processing with Nemotron 70B",
+                status="active",
+            )
+
+        # Generate response with NeMo LLM
+        if self.use_nemo and hasattr(self.llm_service, "generate_stream"):
+            logger.info("Generating with NVIDIA Nemotron")
+            async for chunk in self.llm_service.generate_stream(messages):
+                yield chunk
+        else:
+            # Fallback to OpenAI
+            logger.info("Generating with OpenAI (fallback)")
+            stream = await self.llm_service.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=messages,
+                temperature=settings.LLM_TEMPERATURE,
+                max_tokens=settings.LLM_MAX_TOKENS,
+                stream=True,
+            )
+            async for event in stream:
+                if event.choices and event.choices[0].delta.content:
+                    yield event.choices[0].delta.content
+
+    def _build_messages(
+        self,
+        query: str,
+        context: str,
+        conversation_history: List[ChatMessage] = None,
+    ) -> List[Dict[str, str]]:
+        """
+        Build the chat messages sent to the LLM
+
+        Args:
+            query: User query
+            context: Retrieved document context
+            conversation_history: Previous messages
+
+        Returns:
+            List of message dictionaries
+        """
+        # Build messages
+        messages = [{"role": "system", "content": _SYSTEM_MESSAGE}]
+
+        # Add conversation history if available
+        if conversation_history:
+            for msg in conversation_history[-settings.MAX_CONVERSATION_HISTORY :]:
+                messages.append({"role": msg.role, "content": msg.content})
+
+        # Add context and query as separate trailing messages so everything before
+        # them stays byte-identical across turns and LLM prefix caches can reuse it
+        if context and context.strip():
+            messages.append(
+                {
+                    "role": "user",
+                    "content": f"Here's some relevant healthcare documentation:\n\n{context.strip()}",
+                }
+            )
+            messages.append({"role": "user", "content": f"Question: {query}"})
+        else:
+            messages.append({"role": "user", "content": query})
+
+        return messages
+
+    async def _check_input(self, query: str) -> Optional[Dict[str, Any]]:
+        """
+        Run the guardrails input check if guardrails are enabled
+
+        Args:
+            query: User query
+
+        Returns:
+            Guardrails check result, or None when guardrails are disabled
+        """
+        if not (
+            self.use_nemo
+            and self.guardrails_service
+            and settings.NEMO_GUARDRAILS_ENABLED
+        ):
+            return None
+        return await self.guardrails_service.check_input(query)
+
+    def _blocked_response(self, input_check: Dict[str, Any]) -> str:
+        """Get the refusal returned for input blocked by guardrails"""
+        logger.warning(f"Input blocked by guardrails: {input_check['violations']}")
+        return input_check.get(
+            "safe_response",
+            "I cannot process that request. How else can I help you with healthcare information?",
+        )
 
     def _generate_fallback_response(self, context: str) -> str:
         """
@@ -566,6 +948,183 @@ Question: {query}"""
             f"The above context shows relevant documentation excerpts."
         )
 
+    async def _embed_query(self, query: str) -> Optional[np.ndarray]:
+        """
+        Embed a query for semantic cache lookups and retrieval
+        Uses the vector store's query embedding cache, so retries, refreshes and
+        the search itself share one embedding
+
+        Args:
+            query: User query
+
+        Returns:
+            Embedding vector, or None if the query could not be embedded
+        """
+        try:
+            return await vector_store.embed_query(query)
+        except Exception as e:
+            logger.warning(f"Query embedding failed: {str(e)}")
+            return None
+
+    def _cache_scope(
+        self,
+        query: str,
+        conversation_history: Optional[List[ChatMessage]],
+        use_rag: bool,
+        user_id: Optional[int],
+    ) -> Optional[Tuple]:
+        """
+        Build the semantic cache scope for a request
+        A cached answer is only reused for the same user, conversation state and
+        numbers in the query; anonymous requests are never cached
+        """
+        if user_id is None:
+            return None
+        history = tuple(
+            (msg.role, msg.content)
+            for msg in (conversation_history or [])[
+                -settings.MAX_CONVERSATION_HISTORY :
+            ]
+        )
+        return (user_id, use_rag, hash(history), tuple(_NUMBER_RE.findall(query)))
+
+    def _retrieval_scope(self, top_k: int, score_threshold: float) -> Tuple:
+        """Build the semantic cache scope for prefetched retrieval results"""
+        return ("retrieval", top_k, score_threshold)
+
+    async def _prefetched_documents(
+        self,
+        query: str,
+        top_k: int,
+        score_threshold: float,
+    ) -> Optional[List[SearchHit]]:
+        """
+        Look up retrieval results prefetched for a similar predicted question
+
+        Args:
+            query: Search query
+            top_k: Number of documents to retrieve
+            score_threshold: Minimum relevance score
+
+        Returns:
+            Copies of the prefetched documents, or None on a miss
+        """
+        emit_callback = emit_var.get()
+        query_embedding = await self._embed_query(query)
+        if query_embedding is None:
+            return None
+
+        cached = semantic_cache.lookup(
+            query_embedding, scope=self._retrieval_scope(top_k, score_threshold)
+        )
+        if cached is None:
+            return None
+
+        documents, similarity = cached
+        logger.info(f"Using prefetched documents (similarity {similarity:.3f})")
+        if emit_callback:
+            await emit_callback(
+                step_type="searching",
+                label="Searching vector database",
+                description=f"✓ Using {len(documents)} documents prefetched for a predicted follow-up (similarity: {similarity:.2f})",
+                status="complete",
+            )
+        # Reranking writes scores into the documents, so hand out copies
+        return [replace(doc) for doc in documents]
+
+    async def _predict_follow_ups(self, query: str, response: str) -> List[str]:
+        """
+        Ask the LLM for the questions the user is likely to ask next
+
+        Args:
+            query: User query
+            response: Generated response
+
+        Returns:
+            Predicted follow-up questions
+        """
+        messages = [
+            {
+                "role": "system",
+                "content": _FOLLOW_UP_PROMPT.format(count=settings.PREFETCH_TOPICS),
+            },
+            {"role": "user", "content": f"Question: {query}\n\nAnswer: {response}"},
+        ]
+
+        if self.use_nemo and hasattr(self.llm_service, "generate"):
+            text = await self.llm_service.generate(messages, max_tokens=200)
+        else:
+            completion = await self.llm_service.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=messages,
+                temperature=settings.LLM_TEMPERATURE,
+                max_tokens=200,
+            )
+            text = completion.choices[0].message.content or ""
+
+        questions = []
+        for line in text.splitlines():
+            question = _LIST_MARKER_RE.sub("", line).strip()
+            if question:
+                questions.append(question)
+        return questions[: settings.PREFETCH_TOPICS]
+
+    async def _prefetch(self, query: str, response: str):
+        """
+        Warm the semantic cache with retrieval results for predicted follow-ups
+        Runs in the background; at most one prediction runs at a time, spaced
+        by PREFETCH_MIN_INTERVAL_SECONDS, and new ones are skipped meanwhile
+
+        Args:
+            query: User query that was just answered
+            response: Generated response
+        """
+        # This task inherited the request's context; its searches are not CoT steps
+        emit_var.set(None)
+        if self._prefetch_lock.locked():
+            return
+
+        async with self._prefetch_lock:
+            wait = (
+                self._last_prefetch_at
+                + settings.PREFETCH_MIN_INTERVAL_SECONDS
+                - time.monotonic()
+            )
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._last_prefetch_at = time.monotonic()
+
+            try:
+                questions = await self._predict_follow_ups(query, response)
+                if not questions:
+                    return
+
+                top_k = settings.RETRIEVAL_TOP_K
+                score_threshold = settings.RETRIEVAL_SCORE_THRESHOLD
+                embeddings = await vector_store.embed_batch(
+                    questions, input_type="passage"
+                )
+                results = await asyncio.gather(
+                    *[
+                        vector_store.search(
+                            question,
+                            top_k=top_k,
+                            score_threshold=score_threshold,
+                            query_embedding=embedding,
+                        )
+                        for question, embedding in zip(questions, embeddings)
+                    ]
+                )
+
+                scope = self._retrieval_scope(top_k, score_threshold)
+                for embedding, documents in zip(embeddings, results):
+                    if documents:
+                        semantic_cache.store(embedding, documents, scope=scope)
+                logger.info(f"Prefetched documents for {len(questions)} follow-ups")
+
+            except Exception as e:
+                logger.warning(f"Follow-up prefetch failed: {str(e)}")
+
     async def process_query(
         self,
         query: str,
@@ -573,7 +1132,142 @@ Question: {query}"""
         use_rag: bool = True,
         user_id: Optional[int] = None,
         conversation_id: Optional[int] = None,
-        emit_callback=None,
+        generate: bool = True,
+    ) -> Dict[str, Any]:
+        """
+        Main RAG pipeline entry point
+        Near-duplicate queries in the same conversation state are answered from
+        the semantic cache; everything else runs the full pipeline
+
+        Args:
+            query: User query
+            conversation_history: Previous conversation
+            use_rag: Whether to use RAG (retrieval)
+            user_id: Optional user ID for filtering user-uploaded documents
+            conversation_id: Optional conversation ID for filtering conversation-specific documents
+            generate: Whether to generate a response; callers that generate
+                from a wider context get the RAG context and input check only,
+                and handle the answer cache with lookup_answer/record_answer
+
+        Returns:
+            Dictionary with response, sources, context and metadata (plus
+            input_check when generate is False)
+        """
+        if not generate:
+            return await self._run_pipeline(
+                query,
+                conversation_history,
+                use_rag=use_rag,
+                user_id=user_id,
+                conversation_id=conversation_id,
+                generate=False,
+            )
+
+        cached = await self.lookup_answer(
+            query, conversation_history, use_rag=use_rag, user_id=user_id
+        )
+        if cached is not None:
+            return cached
+
+        result = await self._run_pipeline(
+            query,
+            conversation_history,
+            use_rag=use_rag,
+            user_id=user_id,
+            conversation_id=conversation_id,
+        )
+        await self.record_answer(
+            query, conversation_history, result, use_rag=use_rag, user_id=user_id
+        )
+        return result
+
+    async def lookup_answer(
+        self,
+        query: str,
+        conversation_history: Optional[List[ChatMessage]],
+        use_rag: bool = True,
+        user_id: Optional[int] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Look up the answer to a near-identical question in the semantic cache
+
+        Args:
+            query: User query
+            conversation_history: Previous conversation
+            use_rag: Whether the answer used RAG (retrieval)
+            user_id: ID of the requesting user
+
+        Returns:
+            Cached result with cache_hit set in its metadata, or None on a miss
+        """
+        emit_callback = emit_var.get()
+        scope = self._cache_scope(query, conversation_history, use_rag, user_id)
+        if not semantic_cache.enabled or scope is None:
+            return None
+        query_embedding = await self._embed_query(query)
+        if query_embedding is None:
+            return None
+
+        cached = semantic_cache.lookup(query_embedding, scope=scope)
+        if cached is None:
+            return None
+
+        result, similarity = cached
+        logger.info(f"Semantic cache hit (similarity {similarity:.3f})")
+        if emit_callback:
+            await emit_callback(
+                step_type="cache",
+                label="Found a recent answer",
+                description=f"✓ Reusing the answer to a near-identical question (similarity: {similarity:.2f})",
+                status="complete",
+            )
+        return {**result, "metadata": {**result["metadata"], "cache_hit": True}}
+
+    async def record_answer(
+        self,
+        query: str,
+        conversation_history: Optional[List[ChatMessage]],
+        result: Dict[str, Any],
+        use_rag: bool = True,
+        user_id: Optional[int] = None,
+        cache: bool = True,
+    ):
+        """
+        Store a generated answer in the semantic cache and start prefetching
+        retrieval results for its likely follow-ups
+
+        Args:
+            query: User query
+            conversation_history: Previous conversation
+            result: Result with response, sources, context and metadata
+            use_rag: Whether the answer used RAG (retrieval)
+            user_id: ID of the requesting user
+            cache: Whether the answer may be reused for near-identical questions
+        """
+        metadata = result["metadata"]
+        if "error" in metadata or metadata.get("blocked") or metadata.get("fallback"):
+            # Don't serve refusals or outage text to later paraphrases
+            return
+
+        scope = self._cache_scope(query, conversation_history, use_rag, user_id)
+        if cache and semantic_cache.enabled and scope is not None:
+            query_embedding = await self._embed_query(query)
+            if query_embedding is not None:
+                semantic_cache.store(query_embedding, result, scope=scope)
+
+        if settings.PREFETCH_ENABLED and use_rag and self.llm_service:
+            task = asyncio.create_task(self._prefetch(query, result["response"]))
+            self._prefetch_tasks.add(task)
+            task.add_done_callback(self._prefetch_tasks.discard)
+
+    async def _run_pipeline(
+        self,
+        query: str,
+        conversation_history: List[ChatMessage] = None,
+        use_rag: bool = True,
+        user_id: Optional[int] = None,
+        conversation_id: Optional[int] = None,
+        generate: bool = True,
     ) -> Dict[str, Any]:
         """
         Main RAG pipeline orchestration
@@ -584,7 +1278,7 @@ Question: {query}"""
             use_rag: Whether to use RAG (retrieval)
             user_id: Optional user ID for filtering user-uploaded documents
             conversation_id: Optional conversation ID for filtering conversation-specific documents
-            emit_callback: Optional callback to emit CoT steps
+            generate: Whether to run the generation step
 
         Returns:
             Dictionary with response, sources, context and metadata
@@ -596,75 +1290,89 @@ Question: {query}"""
 
             if not use_rag:
                 # Direct LLM query without retrieval
-                response = await self.generate_response(
-                    query, "", conversation_history, emit_callback=emit_callback
+                if not generate:
+                    return self._context_result(
+                        "", [], {"used_rag": False}, input_check=None
+                    )
+                response, flags = await self.generate_answer(
+                    query, "", conversation_history
                 )
                 return {
                     "response": response,
                     "sources": [],
                     "context": "",
-                    "metadata": {"used_rag": False},
+                    "metadata": {"used_rag": False, **flags},
                 }
 
-            # Step 1: Retrieve documents
+            # Step 1: Retrieve documents while guardrails check the input
             # Don't filter by conversation_id/user_id - retrieve all documents (global + user-specific)
             # The vector store will return the most relevant documents regardless of ownership
-            retrieved_docs = await self.retrieve_documents(
-                query, metadata_filter=None, emit_callback=emit_callback
+            retrieved_docs, input_check = await asyncio.gather(
+                self.retrieve_documents(query, metadata_filter=None),
+                self._check_input(query),
             )
 
+            if input_check is not None and not input_check["allowed"]:
+                return {
+                    "response": self._blocked_response(input_check),
+                    "sources": [],
+                    "context": "",
+                    "metadata": {
+                        "used_rag": True,
+                        "documents_found": len(retrieved_docs),
+                        "blocked": True,
+                    },
+                }
+
             if not retrieved_docs:
                 logger.warning("No documents retrieved")
-                response = await self.generate_response(
+                if not generate:
+                    return self._context_result(
+                        "No relevant documents found.",
+                        [],
+                        {"used_rag": True, "documents_found": 0},
+                        input_check,
+                    )
+                response, flags = await self.generate_answer(
                     query,
                     "No relevant documents found.",
                     conversation_history,
-                    emit_callback=emit_callback,
+                    input_check=input_check,
                 )
                 return {
                     "response": response,
                     "sources": [],
                     "context": "No relevant documents found.",
-                    "metadata": {"used_rag": True, "documents_found": 0},
+                    "metadata": {"used_rag": True, "documents_found": 0, **flags},
                 }
 
             # Step 2: Rerank documents
-            reranked_docs = await self.rerank_documents(
-                query, retrieved_docs, emit_callback=emit_callback
-            )
+            reranked_docs = await self.rerank_documents(query, retrieved_docs)
 
             # Step 3: Build context
-            context = await self.build_context(
-                reranked_docs, emit_callback=emit_callback
-            )
+            context = await self.build_context(reranked_docs)
+            sources = [_source_document(doc) for doc in reranked_docs]
+            metadata = {
+                "used_rag": True,
+                "documents_found": len(retrieved_docs),
+                "documents_used": len(reranked_docs),
+            }
+            if not generate:
+                return self._context_result(context, sources, metadata, input_check)
 
             # Step 4: Generate response
-            response = await self.generate_response(
-                query, context, conversation_history, emit_callback=emit_callback
+            response, flags = await self.generate_answer(
+                query,
+                context,
+                conversation_history,
+                input_check=input_check,
             )
 
-            # Step 5: Format source documents
-            sources = [
-                SourceDocument(
-                    document_id=doc["metadata"].get("document_id", 0),
-                    title=doc["metadata"].get("title", "Untitled"),
-                    content_snippet=doc["text"][:200] + "...",
-                    relevance_score=doc.get("rerank_score", doc["score"]),
-                    source=doc["metadata"].get("source"),
-                    category=doc["metadata"].get("category"),
-                )
-                for doc in reranked_docs
-            ]
-
             return {
                 "response": response,
                 "sources": sources,
                 "context": context,
-                "metadata": {
-                    "used_rag": True,
-                    "documents_found": len(retrieved_docs),
-                    "documents_used": len(reranked_docs),
-                },
+                "metadata": {**metadata, **flags},
             }
 
         except Exception as e:
@@ -676,6 +1384,34 @@ Question: {query}"""
                 "metadata": {"error": str(e)},
             }
 
+    def _context_result(
+        self,
+        context: str,
+        sources: List[SourceDocument],
+        metadata: Dict[str, Any],
+        input_check: Optional[Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """
+        Build the pipeline result returned when generation is left to the caller
+
+        Args:
+            context: Retrieved document context
+            sources: Source documents behind the context
+            metadata: Pipeline metadata
+            input_check: Guardrails input check already run, so the caller can
+                pass it to generate_response instead of checking again
+
+        Returns:
+            Dictionary with no response, plus sources, context, metadata and input_check
+        """
+        return {
+            "response": None,
+            "sources": sources,
+            "context": context,
+            "metadata": metadata,
+            "input_check": input_check,
+        }
+
 
 # Global RAG service instance
 rag_service = RAGService()
@@ -0,0 +1,209 @@
+"""
+Semantic Cache Service
+In-memory cache of pipeline results keyed by query embedding similarity
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from itertools import count
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def quantize_int8(embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Quantize embeddings to int8 with one scale per vector
+
+    Args:
+        embeddings: Float embedding, or a matrix with one embedding per row
+
+    Returns:
+        (int8 embeddings, scales) tuple; scales has one entry per vector (a 0-d
+        array for a single embedding)
+    """
+    peak = np.abs(embeddings).max(axis=-1, keepdims=True)
+    scale = np.where(peak == 0.0, 1.0, peak / 127.0).astype(np.float32)
+    return np.round(embeddings / scale).astype(np.int8), scale[..., 0]
+
+
+class SemanticCacheService:
+    """
+    Cache for results of near-duplicate queries
+    Embeddings are bucketed with random-hyperplane LSH signatures so a lookup only
+    compares against the few entries sharing (or neighbouring) the query's bucket
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: float = None,
+        ttl_seconds: float = None,
+        max_entries: int = None,
+        num_bits: int = None,
+        dtype: str = None,
+        enabled: bool = None,
+    ):
+        self.enabled = settings.SEMANTIC_CACHE_ENABLED if enabled is None else enabled
+        self.similarity_threshold = (
+            similarity_threshold or settings.SEMANTIC_CACHE_SIMILARITY_THRESHOLD
+        )
+        self.ttl_seconds = ttl_seconds or settings.SEMANTIC_CACHE_TTL_SECONDS
+        self.max_entries = max_entries or settings.SEMANTIC_CACHE_MAX_ENTRIES
+        self.num_bits = num_bits or settings.SEMANTIC_CACHE_LSH_BITS
+        # int8 entries take a quarter of the memory of float32 ones
+        self.quantize = (dtype or settings.EMBEDDING_DTYPE) == "int8"
+
+        self._hyperplanes: Optional[np.ndarray] = None  # Created for the first dim
+        self._bit_weights = 1 << np.arange(self.num_bits, dtype=np.int64)
+        # entry_id -> (bucket, stored embedding, scale, value, expires_at), oldest first
+        self._entries: (
+            "OrderedDict[int, Tuple[Tuple, np.ndarray, float, Any, float]]"
+        ) = OrderedDict()
+        self._buckets: Dict[Tuple, List[int]] = {}  # (scope, signature) -> entry ids
+        self._ids = count()
+        self.hits = 0
+        self.misses = 0
+
+    def _unit(self, embedding: List[float]) -> Optional[np.ndarray]:
+        """Normalize an embedding so cosine similarity becomes a dot product"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if vector.ndim != 1 or norm == 0.0:
+            return None
+        return vector / norm
+
+    def _encode(self, vector: np.ndarray) -> Tuple[np.ndarray, float]:
+        """
+        Convert a unit embedding to its stored form
+
+        Args:
+            vector: Unit embedding
+
+        Returns:
+            (stored vector, scale) tuple; stored @ query * scale approximates the
+            cosine similarity
+        """
+        if not self.quantize:
+            return vector, 1.0
+        stored, scale = quantize_int8(vector)
+        return stored, float(scale)
+
+    def _signature(self, vector: np.ndarray) -> int:
+        """Compute the LSH signature (one bit per hyperplane side)"""
+        if self._hyperplanes is None or self._hyperplanes.shape[1] != vector.shape[0]:
+            # A new embedding size invalidates every stored signature
+            rng = np.random.default_rng(0)
+            self._hyperplanes = rng.standard_normal(
+                (self.num_bits, vector.shape[0])
+            ).astype(np.float32)
+            self._entries.clear()
+            self._buckets.clear()
+        bits = (self._hyperplanes @ vector) > 0
+        return int(bits @ self._bit_weights)
+
+    def _remove(self, entry_id: int):
+        """Drop an entry from both the entry map and its bucket"""
+        bucket = self._entries.pop(entry_id)[0]
+        ids = self._buckets.get(bucket)
+        if ids is not None:
+            ids.remove(entry_id)
+            if not ids:
+                del self._buckets[bucket]
+
+    def lookup(
+        self, embedding: List[float], scope: Hashable = None
+    ) -> Optional[Tuple[Any, float]]:
+        """
+        Find a cached value for a near-duplicate query
+
+        Args:
+            embedding: Query embedding
+            scope: Entries only match lookups with an equal scope
+
+        Returns:
+            (cached value, similarity) tuple, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        vector = self._unit(embedding)
+        if vector is None:
+            return None
+
+        signature = self._signature(vector)
+        now = time.monotonic()
+        best_id, best_score = None, self.similarity_threshold
+
+        # Probe the query's bucket plus every bucket one bit away, since near
+        # duplicates often differ in a single hyperplane
+        for flip in range(-1, self.num_bits):
+            probe = signature if flip < 0 else signature ^ (1 << flip)
+            for entry_id in list(self._buckets.get((scope, probe), ())):
+                _, cached_vector, scale, _, expires_at = self._entries[entry_id]
+                if expires_at <= now:
+                    self._remove(entry_id)
+                    continue
+                score = float(cached_vector @ vector) * scale
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+        if best_id is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return self._entries[best_id][3], best_score
+
+    def store(self, embedding: List[float], value: Any, scope: Hashable = None):
+        """
+        Cache a value for a query embedding
+
+        Args:
+            embedding: Query embedding
+            value: Value returned to later near-duplicate lookups
+            scope: Entries only match lookups with an equal scope
+        """
+        if not self.enabled:
+            return
+
+        vector = self._unit(embedding)
+        if vector is None:
+            return
+
+        bucket = (scope, self._signature(vector))
+        entry_id = next(self._ids)
+        stored, scale = self._encode(vector)
+        self._entries[entry_id] = (
+            bucket,
+            stored,
+            scale,
+            value,
+            time.monotonic() + self.ttl_seconds,
+        )
+        self._buckets.setdefault(bucket, []).append(entry_id)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        """Clear all cached entries"""
+        self._entries.clear()
+        self._buckets.clear()
+        logger.info("Semantic cache cleared")
+
+    def get_stats(self) -> Dict:
+        """Get cache statistics"""
+        return {
+            "entries": len(self._entries),
+            "buckets": len(self._buckets),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Global semantic cache for full RAG pipeline results
+semantic_cache = SemanticCacheService()
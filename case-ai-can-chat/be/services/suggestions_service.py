@@ -1,10 +1,45 @@
 import logging
-from typing import Callable, List, Optional
+import re
+from typing import List, Optional, Tuple
 
+from core.cot_context import emit_var
 from schemas.schemas import ChatMessage
 
 logger = logging.getLogger(__name__)
 
+# Number of suggestions returned; short lists are padded with defaults
+_MIN_SUGGESTIONS = 3
+_MAX_SUGGESTIONS = 6
+
+# Characters of each message included in the suggestion prompt
+_MAX_CONTEXT_CHARS = 200
+
+# Leading numbering ("1." / "2)") or bullet ("-", "•", "*") on a response line
+_LEAD_RE = re.compile(r"^\s*(?:\d+[.)]\s*|[-•*]\s+)")
+
+# Suggestions used when generation fails or no history is available
+_DEFAULTS = (
+    "What healthcare services are available?",
+    "How can I access my medical records?",
+    "Tell me about preventive care programs",
+    "What telehealth options exist?",
+)
+
+
+def _format_message(msg) -> str:
+    """Format a ChatMessage or message dict as a 'Role: content' context line"""
+    # Handle both ChatMessage objects and dicts
+    if isinstance(msg, dict):
+        role = msg.get("role", "user")
+        content = msg.get("content", "")
+    else:
+        role = msg.role
+        content = msg.content
+    # Truncate long messages
+    if len(content) > _MAX_CONTEXT_CHARS:
+        content = content[:_MAX_CONTEXT_CHARS]
+    return f"{role.capitalize()}: {content}"
+
 
 class SuggestionsService:
     """
@@ -28,18 +63,17 @@ class SuggestionsService:
     async def generate_suggestions(
         self,
         conversation_history: List[ChatMessage],
-        emit_callback: Optional[Callable] = None,
     ) -> List[str]:
         """
         Generate follow-up suggestions based on conversation history
 
         Args:
             conversation_history: Recent conversation messages
-            emit_callback: Optional callback to emit CoT steps
 
         Returns:
             List of suggestion strings (3-6 suggestions)
         """
+        emit_callback = emit_var.get()
         try:
             # Emit CoT step
             if emit_callback:
@@ -58,7 +92,7 @@ class SuggestionsService:
                         label="Generating follow-up suggestions",
                         status="complete",
                     )
-                return self._get_default_suggestions()
+                return list(self._get_default_suggestions())
 
             # Take last 5-10 messages for context
             recent_messages = (
@@ -68,18 +102,7 @@ class SuggestionsService:
             )
 
             # Build conversation context
-            context_parts = []
-            for msg in recent_messages:
-                # Handle both ChatMessage objects and dicts
-                if isinstance(msg, dict):
-                    role = msg.get("role", "user").capitalize()
-                    content = msg.get("content", "")[:200]
-                else:
-                    role = msg.role.capitalize()
-                    content = msg.content[:200]  # Truncate long messages
-                context_parts.append(f"{role}: {content}")
-
-            conversation_context = "\n".join(context_parts)
+            conversation_context = "\n".join(map(_format_message, recent_messages))
 
             # Create prompt for suggestions generation
             prompt = f"""Based on this conversation about healthcare services:
@@ -104,12 +127,14 @@ Return ONLY the questions, one per line, without numbering or bullet points."""
 
             # Generate suggestions
             logger.info("Generating suggestions with Nemotron")
-            response = await self.llm_service.generate(
-                messages, temperature=0.8, max_tokens=300
-            )
-
-            # Parse response into list of suggestions
-            suggestions = self._parse_suggestions(response)
+            if hasattr(self.llm_service, "generate_stream"):
+                suggestions = await self._stream_suggestions(messages)
+            else:
+                response = await self.llm_service.generate(
+                    messages, temperature=0.8, max_tokens=300
+                )
+                # Parse response into list of suggestions
+                suggestions = self._parse_suggestions(response)
 
             if emit_callback:
                 await emit_callback(
@@ -130,7 +155,53 @@ Return ONLY the questions, one per line, without numbering or bullet points."""
                     label="Generating follow-up suggestions",
                     status="error",
                 )
-            return self._get_default_suggestions()
+            return list(self._get_default_suggestions())
+
+    async def _stream_suggestions(self, messages: List[dict]) -> List[str]:
+        """
+        Stream the LLM response and collect suggestions as each line completes
+        Every new suggestion is emitted right away, and the stream is closed as
+        soon as enough suggestions have been collected
+
+        Args:
+            messages: Prompt messages
+
+        Returns:
+            List of suggestion strings
+        """
+        emit_callback = emit_var.get()
+        suggestions = []
+        buffer = ""
+        stream = self.llm_service.generate_stream(
+            messages, temperature=0.8, max_tokens=300
+        )
+        try:
+            async for chunk in stream:
+                buffer += chunk
+                while "\n" in buffer and len(suggestions) < _MAX_SUGGESTIONS:
+                    line, buffer = buffer.split("\n", 1)
+                    suggestion = self._clean_line(line)
+                    if suggestion:
+                        suggestions.append(suggestion)
+                        if emit_callback:
+                            await emit_callback(
+                                step_type="suggestions",
+                                label="Generating follow-up suggestions",
+                                description="\n".join(suggestions),
+                                status="active",
+                            )
+                if len(suggestions) >= _MAX_SUGGESTIONS:
+                    break
+        finally:
+            await stream.aclose()
+
+        # The last line has no trailing newline
+        if len(suggestions) < _MAX_SUGGESTIONS:
+            suggestion = self._clean_line(buffer)
+            if suggestion:
+                suggestions.append(suggestion)
+
+        return self._pad_suggestions(suggestions)
 
     def _parse_suggestions(self, response: str) -> List[str]:
         """
@@ -142,49 +213,54 @@ Return ONLY the questions, one per line, without numbering or bullet points."""
         Returns:
             List of suggestion strings
         """
-        # Split by newlines and clean up
-        lines = response.strip().split("\n")
         suggestions = []
+        for line in response.split("\n"):
+            suggestion = self._clean_line(line)
+            if suggestion:
+                suggestions.append(suggestion)
+                if len(suggestions) == _MAX_SUGGESTIONS:
+                    break
+
+        return self._pad_suggestions(suggestions)
+
+    def _clean_line(self, line: str) -> Optional[str]:
+        """
+        Clean one line of LLM output into a suggestion
 
-        for line in lines:
-            # Clean up line
-            line = line.strip()
+        Args:
+            line: Raw response line
 
-            # Remove numbering if present (1. 2. etc)
-            if line and line[0].isdigit() and "." in line[:3]:
-                line = line.split(".", 1)[1].strip()
+        Returns:
+            Suggestion string, or None if the line is not a usable suggestion
+        """
+        # Remove numbering and bullet points
+        line = _LEAD_RE.sub("", line, count=1).strip()
 
-            # Remove bullet points
-            if line.startswith(("- ", "• ", "* ")):
-                line = line[2:].strip()
+        # Minimum length check
+        return line if len(line) > 10 else None
 
-            # Add if valid
-            if line and len(line) > 10:  # Minimum length check
-                suggestions.append(line)
+    def _pad_suggestions(self, suggestions: List[str]) -> List[str]:
+        """
+        Pad a short suggestion list with defaults
 
-        # Return 3-6 suggestions
-        if len(suggestions) > 6:
-            suggestions = suggestions[:6]
-        elif len(suggestions) < 3:
-            # Pad with defaults if needed
-            defaults = self._get_default_suggestions()
-            suggestions.extend(defaults[: 3 - len(suggestions)])
+        Args:
+            suggestions: Parsed suggestions
 
+        Returns:
+            At least _MIN_SUGGESTIONS suggestions
+        """
+        if len(suggestions) < _MIN_SUGGESTIONS:
+            suggestions.extend(_DEFAULTS[: _MIN_SUGGESTIONS - len(suggestions)])
         return suggestions
 
-    def _get_default_suggestions(self) -> List[str]:
+    def _get_default_suggestions(self) -> Tuple[str, ...]:
         """
         Get default suggestions when generation fails or no history available
 
         Returns:
-            List of default suggestion strings
+            Tuple of default suggestion strings
         """
-        return [
-            "What healthcare services are available?",
-            "How can I access my medical records?",
-            "Tell me about preventive care programs",
-            "What telehealth options exist?",
-        ]
+        return _DEFAULTS
 
 
 # Global suggestions service instance
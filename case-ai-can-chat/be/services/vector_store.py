@@ -1,12 +1,117 @@
+import asyncio
+import hashlib
 import logging
-from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
 
 import chromadb
+import numpy as np
 from chromadb.config import Settings as ChromaSettings
 from core.config import settings
+from core.cot_context import emit_var
 
 logger = logging.getLogger(__name__)
 
+# Query embeddings kept for repeated searches
+_QUERY_EMBEDDING_CACHE_SIZE = 4096
+
+
+@dataclass(slots=True)
+class SearchHit:
+    """
+    A chunk returned by a similarity search
+    rerank_score is filled in by the RAG pipeline's reranking step
+    """
+
+    text: str
+    metadata: Dict[str, Any]
+    score: float
+    title: str
+    id: Optional[str]
+    rerank_score: Optional[float] = None
+
+    @property
+    def relevance(self) -> float:
+        """Rerank score if the hit was reranked, otherwise the similarity score"""
+        return self.score if self.rerank_score is None else self.rerank_score
+
+
+class _BatchQueue:
+    """
+    Coalesces concurrent single-text embedding calls into batched NIM requests
+    Texts submitted within the batch window share one request; a full batch is
+    flushed immediately
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], Awaitable[np.ndarray]],
+        window_ms: float,
+        max_batch: int,
+    ):
+        self._embed_batch = embed_batch
+        self._window = window_ms / 1000.0
+        self._max_batch = max_batch
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, text: str) -> np.ndarray:
+        """
+        Queue a text and wait for its embedding
+
+        Args:
+            text: Input text to embed
+
+        Returns:
+            Embedding vector
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self._max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        """Send every pending text as one batch"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            # Keep a reference so the task isn't garbage collected mid-request
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]):
+        """Embed a batch and resolve each caller's future"""
+        try:
+            embeddings = await self._embed_batch([text for text, _ in batch])
+            if len(embeddings) != len(batch):
+                raise RuntimeError(
+                    f"Expected {len(batch)} embeddings, got {len(embeddings)}"
+                )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), embedding in zip(batch, embeddings):
+            # Callers that were cancelled while waiting have already resolved
+            if not future.done():
+                # Copy the row: callers cache their embedding, and a view would
+                # keep the whole batch array alive
+                future.set_result(np.array(embedding, dtype=np.float32))
+
 
 class VectorStoreService:
     """
@@ -21,6 +126,12 @@ class VectorStoreService:
         self.embedding_service = None
         self.initialized = False
         self.use_nemo = settings.NEMO_ENABLED  # Track if using NVIDIA NeMo embeddings
+        self._batch_queues: Dict[str, _BatchQueue] = {}  # input_type -> queue
+        self._heartbeat_client = None  # Async HTTP client, set when using HttpClient
+        self._heartbeat_url = None
+        # sha256(query) -> float32 embedding, least recently used first. Kept
+        # at full precision since it feeds the ANN search directly
+        self._query_embeddings: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
 
     async def initialize(self):
         """
@@ -34,43 +145,46 @@ class VectorStoreService:
             # Try to connect to ChromaDB - first HTTP (Docker), then local (development)
             chroma_host = settings.CHROMADB_HOST
             chroma_port = settings.CHROMADB_PORT
+            heartbeat_url = f"http://{chroma_host}:{chroma_port}/api/v2/heartbeat"
 
             # Try HTTP client first (for Docker/production) with retry logic
             try:
                 logger.info(
                     f"Attempting to connect to ChromaDB at {chroma_host}:{chroma_port}"
                 )
-                import asyncio
-
                 import httpx
 
-                # Retry logic: wait for ChromaDB to be ready
+                # Retry logic: wait for ChromaDB to be ready, backing off exponentially
                 max_retries = 10
-                retry_delay = 2
+                max_retry_delay = 4.0
                 connected = False
 
+                heartbeat_client = httpx.AsyncClient(timeout=2.0)
                 for attempt in range(1, max_retries + 1):
                     try:
-                        response = httpx.get(
-                            f"http://{chroma_host}:{chroma_port}/api/v2/heartbeat",
-                            timeout=2.0,
-                        )
+                        response = await heartbeat_client.get(heartbeat_url)
                         if response.status_code == 200:
                             logger.info(
                                 f"ChromaDB HTTP service detected (attempt {attempt}/{max_retries}), using HttpClient"
                             )
                             connected = True
                             break
-                    except Exception as e:
-                        if attempt < max_retries:
-                            logger.info(
-                                f"ChromaDB not ready yet (attempt {attempt}/{max_retries}), retrying in {retry_delay}s..."
-                            )
-                            await asyncio.sleep(retry_delay)
-                        else:
+                    except httpx.HTTPError as e:
+                        if attempt == max_retries:
+                            await heartbeat_client.aclose()
                             raise e
 
+                    if attempt < max_retries:
+                        retry_delay = min(0.5 * 2 ** (attempt - 1), max_retry_delay)
+                        logger.info(
+                            f"ChromaDB not ready yet (attempt {attempt}/{max_retries}), retrying in {retry_delay}s..."
+                        )
+                        await asyncio.sleep(retry_delay)
+
                 if connected:
+                    # Kept open for later heartbeat probes
+                    self._heartbeat_client = heartbeat_client
+                    self._heartbeat_url = heartbeat_url
                     self.client = chromadb.HttpClient(
                         host=chroma_host,
                         port=chroma_port,
@@ -79,6 +193,7 @@ class VectorStoreService:
                         ),
                     )
                 else:
+                    await heartbeat_client.aclose()
                     raise Exception("ChromaDB not responding after retries")
             except Exception as http_error:
                 # Fallback to embedded/persistent client for local development
@@ -121,7 +236,7 @@ class VectorStoreService:
             logger.error(f"Failed to initialize vector store: {str(e)}", exc_info=True)
             raise
 
-    async def embed_text(self, text: str, input_type: str = "passage") -> List[float]:
+    async def embed_text(self, text: str, input_type: str = "passage") -> np.ndarray:
         """
         Generate embeddings for text using NIM endpoint
 
@@ -130,24 +245,37 @@ class VectorStoreService:
             input_type: Type of input - "query" for search queries, "passage" for documents
 
         Returns:
-            List of embedding values
+            Embedding as a float32 array (converted to a list only at the Chroma call)
         """
         if not self.initialized:
             raise RuntimeError("Vector store not initialized")
 
         try:
-            # Use NIM embeddings service only (async version)
-            embedding = await self.embedding_service.encode_async(
-                text, input_type=input_type
-            )
-            return embedding
+            if settings.EMBEDDING_BATCH_WINDOW_MS <= 0:
+                # Use NIM embeddings service only (async version)
+                embedding = await self.embedding_service.encode_async(
+                    text, input_type=input_type
+                )
+                return np.asarray(embedding, dtype=np.float32)
+
+            # Concurrent callers share one batched NIM request
+            queue = self._batch_queues.get(input_type)
+            if queue is None:
+                queue = self._batch_queues[input_type] = _BatchQueue(
+                    lambda texts: self.embedding_service.encode_batch_async(
+                        texts, input_type=input_type
+                    ),
+                    settings.EMBEDDING_BATCH_WINDOW_MS,
+                    settings.EMBEDDING_MAX_BATCH,
+                )
+            return np.asarray(await queue.submit(text), dtype=np.float32)
         except Exception as e:
             logger.error(f"Error generating embedding via NIM: {str(e)}", exc_info=True)
             raise
 
     async def embed_batch(
         self, texts: List[str], input_type: str = "passage"
-    ) -> List[List[float]]:
+    ) -> np.ndarray:
         """
         Generate embeddings for multiple texts using NIM endpoint
 
@@ -156,7 +284,7 @@ class VectorStoreService:
             input_type: Type of input - "query" for search queries, "passage" for documents
 
         Returns:
-            List of embedding vectors
+            (len(texts), dimension) float32 array of embedding vectors
         """
         if not self.initialized:
             raise RuntimeError("Vector store not initialized")
@@ -173,6 +301,28 @@ class VectorStoreService:
             )
             raise
 
+    async def embed_query(self, query: str) -> np.ndarray:
+        """
+        Embed a search query, reusing the embedding of a recently seen identical query
+
+        Args:
+            query: Search query
+
+        Returns:
+            Query embedding as a float32 array
+        """
+        key = hashlib.sha256(query.encode("utf-8")).digest()
+        embedding = self._query_embeddings.get(key)
+        if embedding is not None:
+            self._query_embeddings.move_to_end(key)
+            return embedding
+
+        embedding = await self.embed_text(query, input_type="passage")
+        self._query_embeddings[key] = embedding
+        if len(self._query_embeddings) > _QUERY_EMBEDDING_CACHE_SIZE:
+            self._query_embeddings.popitem(last=False)
+        return embedding
+
     async def add_documents(
         self, texts: List[str], metadatas: List[Dict[str, Any]], ids: List[str]
     ) -> bool:
@@ -196,9 +346,12 @@ class VectorStoreService:
             # Generate embeddings
             embeddings = await self.embed_batch(texts)
 
-            # Add to collection
+            # Add to collection (Chroma validates embeddings as Python lists)
             self.collection.add(
-                embeddings=embeddings, documents=texts, metadatas=metadatas, ids=ids
+                embeddings=embeddings.tolist(),
+                documents=texts,
+                metadatas=metadatas,
+                ids=ids,
             )
 
             logger.info(f"Successfully added {len(texts)} documents")
@@ -214,8 +367,8 @@ class VectorStoreService:
         top_k: int = None,
         score_threshold: float = None,
         filter_metadata: Optional[Dict[str, Any]] = None,
-        emit_callback=None,
-    ) -> List[Dict[str, Any]]:
+        query_embedding: Optional[Union[np.ndarray, List[float]]] = None,
+    ) -> List[SearchHit]:
         """
         Search for similar documents using semantic search
 
@@ -224,11 +377,12 @@ class VectorStoreService:
             top_k: Number of results to return
             score_threshold: Minimum similarity score
             filter_metadata: Optional metadata filters
-            emit_callback: Optional callback to emit CoT steps
+            query_embedding: Precomputed embedding of the query, if the caller has one
 
         Returns:
             List of search results with scores
         """
+        emit_callback = emit_var.get()
         if not self.initialized:
             raise RuntimeError("Vector store not initialized")
 
@@ -261,42 +415,49 @@ class VectorStoreService:
             logger.debug(f"Searching with query: '{query[:100]}...'")
 
             # Generate query embedding (use "passage" - same as documents, since "query" gives poor results)
-            query_embedding = await self.embed_text(query, input_type="passage")
-            embedding_dim = len(query_embedding)
+            if query_embedding is None:
+                query_embedding = await self.embed_query(query)
+            embedding_dim = settings.EMBEDDING_DIMENSION
 
             # Perform search
             results = self.collection.query(
-                query_embeddings=[query_embedding],
+                query_embeddings=[
+                    (
+                        query_embedding.tolist()
+                        if isinstance(query_embedding, np.ndarray)
+                        else query_embedding
+                    )
+                ],
                 n_results=top_k,
                 where=filter_metadata,
                 include=["documents", "metadatas", "distances"],
             )
 
             # Process results
-            processed_results = []
+            processed_results: List[SearchHit] = []
             total_found = 0
             if results and results["documents"] and len(results["documents"]) > 0:
-                total_found = len(results["documents"][0])
-                for i in range(total_found):
-                    # Convert distance to similarity score (cosine similarity)
-                    distance = results["distances"][0][i]
-                    similarity_score = 1 - distance
-
-                    # Filter by score threshold
-                    if similarity_score >= score_threshold:
-                        processed_results.append(
-                            {
-                                "text": results["documents"][0][i],
-                                "metadata": results["metadatas"][0][i],
-                                "score": float(similarity_score),
-                                "title": results["metadatas"][0][i].get(
-                                    "title", "Untitled"
-                                ),
-                                "id": (
-                                    results["ids"][0][i] if "ids" in results else None
-                                ),
-                            }
-                        )
+                docs = results["documents"][0]
+                metas = results["metadatas"][0]
+                total_found = len(docs)
+                ids = results["ids"][0] if "ids" in results else [None] * total_found
+
+                # Convert distances to similarity scores (cosine similarity) and
+                # filter by score threshold in one vectorized pass
+                similarity_scores = 1.0 - np.asarray(
+                    results["distances"][0], dtype=np.float64
+                )
+                keep = np.flatnonzero(similarity_scores >= score_threshold)
+                processed_results = [
+                    SearchHit(
+                        docs[i],
+                        metas[i],
+                        score,
+                        metas[i].get("title", "Untitled"),
+                        ids[i],
+                    )
+                    for i, score in zip(keep.tolist(), similarity_scores[keep].tolist())
+                ]
 
             logger.info(f"Found {len(processed_results)} relevant documents")
 
@@ -328,6 +489,31 @@ class VectorStoreService:
                 )
             raise
 
+    async def check_heartbeat(self) -> bool:
+        """
+        Check that the ChromaDB HTTP service is responding
+
+        Returns:
+            True if ChromaDB answered the heartbeat; always True for the embedded client
+        """
+        if self._heartbeat_client is None:
+            return self.client is not None
+
+        try:
+            response = await self._heartbeat_client.get(self._heartbeat_url)
+            return response.status_code == 200
+        except Exception as e:
+            logger.warning(f"ChromaDB heartbeat failed: {str(e)}")
+            return False
+
+    async def close(self):
+        """
+        Close the heartbeat HTTP client
+        """
+        if self._heartbeat_client is not None:
+            await self._heartbeat_client.aclose()
+            self._heartbeat_client = None
+
     async def delete_documents(self, ids: List[str]) -> bool:
         """
         Delete documents from the vector store
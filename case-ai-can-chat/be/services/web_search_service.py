@@ -1,19 +1,135 @@
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
+import time
+from collections import OrderedDict
+from typing import AsyncGenerator, Iterable, List, Dict, Any, Optional, Set, Tuple
+import numpy as np
 from duckduckgo_search import AsyncDDGS
 from core.config import settings
+from services.semantic_cache_service import SemanticCacheService, quantize_int8
+from services.vector_store import vector_store
 
 logger = logging.getLogger(__name__)
 
 
+class _CachedResults:
+    """
+    Cached search results stored column-wise, with optional unit body embeddings
+    so results can be ranked against a new query with a single matrix product.
+    Embeddings may be kept as int8 rows with per-row scales to save memory.
+    """
+
+    __slots__ = ("titles", "hrefs", "bodies", "embeddings", "scales")
+
+    def __init__(
+        self,
+        results: List[Dict[str, Any]],
+        embeddings: Optional[np.ndarray] = None,
+        quantize: bool = False,
+    ):
+        self.titles = [r["title"] for r in results]
+        self.hrefs = [r["href"] for r in results]
+        self.bodies = [r["body"] for r in results]
+        self.embeddings = embeddings  # (n, d) float32 or int8, or None
+        self.scales = None  # (n,) float32 row scales when embeddings are int8
+        if quantize and embeddings is not None:
+            self.embeddings, self.scales = quantize_int8(embeddings)
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def rows(self, indices: Iterable[int]) -> List[Dict[str, Any]]:
+        """Builds result dictionaries for the given positions."""
+        return [
+            {"title": self.titles[i], "href": self.hrefs[i], "body": self.bodies[i]}
+            for i in indices
+        ]
+
+    def top(
+        self, num_results: int, query_embedding: Optional[np.ndarray] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Returns up to num_results results.
+
+        Args:
+            num_results: Number of results to return.
+            query_embedding: If given (and bodies were embedded), results are ordered
+                by similarity to it; otherwise the search engine's order is kept.
+
+        Returns:
+            A list of result dictionaries.
+        """
+        if self.embeddings is None or query_embedding is None:
+            return self.rows(range(min(num_results, len(self))))
+
+        scores = self.embeddings @ np.asarray(query_embedding, dtype=np.float32)
+        if self.scales is not None:
+            scores *= self.scales
+        if num_results < len(scores):
+            top = np.argpartition(-scores, num_results - 1)[:num_results]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return self.rows(top.tolist())
+
+
+class _PendingSearch:
+    """
+    A web search in flight. Results are appended as DuckDuckGo returns them
+    and every consumer streams them from the start.
+    """
+
+    def __init__(self, num_results: int):
+        self.num_results = num_results
+        self.results: List[Dict[str, Any]] = []
+        self.done = False
+        self._changed = asyncio.Event()
+
+    def add(self, result: Dict[str, Any]):
+        """Appends a result and wakes waiting consumers."""
+        self.results.append(result)
+        self._changed.set()
+
+    def finish(self):
+        """Marks the search complete and wakes waiting consumers."""
+        self.done = True
+        self._changed.set()
+
+    async def stream(self) -> AsyncGenerator[Dict[str, Any], None]:
+        """Yields results collected so far, then each new one until the search completes."""
+        index = 0
+        while True:
+            while index < len(self.results):
+                yield self.results[index]
+                index += 1
+            if self.done:
+                return
+            self._changed.clear()
+            await self._changed.wait()
+
+
 class WebSearchService:
     """
     Service for performing web searches using DuckDuckGo.
-    Includes basic caching to avoid redundant searches.
+    Results are cached in a bounded LRU with TTL, backed by an embedding-keyed
+    cache so paraphrased queries reuse earlier searches.
     """
 
     def __init__(self):
-        self.cache: Dict[str, List[Dict[str, Any]]] = {}
+        # normalized query -> (num_results requested, results, expires_at), oldest first
+        self.cache: "OrderedDict[str, Tuple[int, _CachedResults, float]]" = (
+            OrderedDict()
+        )
+        self.cache_ttl_seconds = settings.WEB_SEARCH_CACHE_TTL_SECONDS
+        self.cache_max_entries = settings.WEB_SEARCH_CACHE_MAX_ENTRIES
+        self.semantic_cache = SemanticCacheService(
+            similarity_threshold=settings.WEB_SEARCH_CACHE_SIMILARITY_THRESHOLD,
+            ttl_seconds=self.cache_ttl_seconds,
+            max_entries=self.cache_max_entries,
+            enabled=settings.WEB_SEARCH_SEMANTIC_CACHE_ENABLED,
+        )
+        self._pending: Dict[str, _PendingSearch] = {}  # normalized query -> search
+        self._tasks: Set[asyncio.Task] = set()
         self.max_results = settings.WEB_SEARCH_MAX_RESULTS
         self.region = settings.WEB_SEARCH_REGION
         logger.info(
@@ -33,31 +149,112 @@ class WebSearchService:
         Returns:
             A list of dictionaries, each representing a search result with 'title', 'href', and 'body'.
         """
+        return [result async for result in self.search_stream(query, num_results)]
+
+    async def search_stream(
+        self, query: str, num_results: Optional[int] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Performs a web search using DuckDuckGo, yielding results as they arrive.
+        Identical queries already in flight share the same search.
+
+        Args:
+            query: The search query string.
+            num_results: Optional number of results to return. Defaults to settings.WEB_SEARCH_MAX_RESULTS.
+
+        Yields:
+            Dictionaries with 'title', 'href', and 'body' for each search result.
+        """
         if not settings.ENABLE_WEB_SEARCH:
             logger.info("Web search is disabled by configuration.")
-            return []
+            return
 
         effective_num_results = (
             num_results if num_results is not None else self.max_results
         )
 
-        if query in self.cache:
+        key = self._normalize(query)
+        cached = self._get_cached(key, effective_num_results)
+        if cached is not None:
             logger.debug(f"Returning cached search results for query: {query}")
-            return self.cache[query][:effective_num_results]
+            for result in cached:
+                yield result
+            return
 
+        pending = self._get_pending(key, effective_num_results)
+        if pending is None:
+            # Near-duplicate queries ("find doctor" vs "find a doctor") share results
+            query_embedding = await self._embed(query)
+            if query_embedding is not None:
+                hit = self.semantic_cache.lookup(query_embedding)
+                if hit is not None and hit[0][0] >= effective_num_results:
+                    logger.debug(
+                        f"Returning semantically cached search results for query: {query} (similarity {hit[1]:.3f})"
+                    )
+                    # Rank the paraphrase's results against this query
+                    for result in hit[0][1].top(effective_num_results, query_embedding):
+                        yield result
+                    return
+
+            # Another request may have started the same search while embedding
+            pending = self._get_pending(key, effective_num_results)
+            if pending is None:
+                pending = self._start_search(
+                    key, query, effective_num_results, query_embedding
+                )
+
+        count = 0
+        async for result in pending.stream():
+            yield result
+            count += 1
+            if count == effective_num_results:
+                break
+
+    def _get_pending(self, key: str, num_results: int) -> Optional["_PendingSearch"]:
+        """Returns the in-flight search for the query if it covers the requested count."""
+        pending = self._pending.get(key)
+        if pending is not None and pending.num_results >= num_results:
+            return pending
+        return None
+
+    def _start_search(
+        self,
+        key: str,
+        query: str,
+        num_results: int,
+        query_embedding: Optional[np.ndarray],
+    ) -> "_PendingSearch":
+        """Starts a DuckDuckGo search in the background and registers it as in flight."""
+        pending = _PendingSearch(num_results)
+        self._pending[key] = pending
+        # Keep a reference so the task isn't garbage collected mid-search
+        task = asyncio.create_task(
+            self._run_search(key, query, pending, query_embedding)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return pending
+
+    async def _run_search(
+        self,
+        key: str,
+        query: str,
+        pending: "_PendingSearch",
+        query_embedding: Optional[np.ndarray],
+    ):
+        """Collects DuckDuckGo results into the pending search, then caches them."""
         logger.info(
-            f"Performing web search for query: '{query}' with {effective_num_results} results"
+            f"Performing web search for query: '{query}' with {pending.num_results} results"
         )
         try:
-            results = []
             async with AsyncDDGS() as ddgs:
                 ddgs_results = ddgs.text(
                     keywords=query,
                     region=self.region,
-                    max_results=effective_num_results,
+                    max_results=pending.num_results,
                 )
                 async for r in ddgs_results:
-                    results.append(
+                    pending.add(
                         {
                             "title": r.get("title"),
                             "href": r.get("href"),
@@ -65,18 +262,119 @@ class WebSearchService:
                         }
                     )
 
-            self.cache[query] = results  # Cache all retrieved results
-            logger.info(f"Found {len(results)} web search results for '{query}'")
-            return results
+            # Consumers have every result; caching below doesn't hold them up
+            pending.finish()
+            logger.info(
+                f"Found {len(pending.results)} web search results for '{query}'"
+            )
+
+            # Cache all retrieved results
+            results = _CachedResults(
+                pending.results,
+                await self._embed_bodies(pending.results, query_embedding),
+                quantize=self.semantic_cache.quantize,
+            )
+            self._set_cached(key, pending.num_results, results)
+            if query_embedding is not None:
+                self.semantic_cache.store(
+                    query_embedding, (pending.num_results, results)
+                )
         except Exception as e:
             logger.error(
                 f"Error during web search for '{query}': {str(e)}", exc_info=True
             )
-            return []
+        finally:
+            pending.finish()
+            if self._pending.get(key) is pending:
+                del self._pending[key]
+
+    def _normalize(self, query: str) -> str:
+        """Normalizes case and whitespace so trivially different queries share a key."""
+        return " ".join(query.lower().split())
+
+    def _get_cached(self, key: str, num_results: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Looks up unexpired cached results covering the requested count.
+
+        Args:
+            key: Normalized query.
+            num_results: Number of results requested.
+
+        Returns:
+            The cached results, or None on a miss.
+        """
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+
+        cached_num_results, results, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self.cache[key]
+            return None
+        if cached_num_results < num_results:
+            return None
+
+        self.cache.move_to_end(key)
+        return results.top(num_results)
+
+    def _set_cached(self, key: str, num_results: int, results: _CachedResults):
+        """Stores results and evicts the least recently used entries over the limit."""
+        self.cache[key] = (
+            num_results,
+            results,
+            time.monotonic() + self.cache_ttl_seconds,
+        )
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_max_entries:
+            self.cache.popitem(last=False)
+
+    async def _embed(self, query: str) -> Optional[np.ndarray]:
+        """Embeds the query for the semantic cache, or returns None if unavailable."""
+        if not self.semantic_cache.enabled or not vector_store.initialized:
+            return None
+        try:
+            # Bodies are embedded as passages; the query side uses "query"
+            return await vector_store.embed_text(query, input_type="query")
+        except Exception as e:
+            logger.warning(f"Skipping semantic web search cache: {str(e)}")
+            return None
+
+    async def _embed_bodies(
+        self,
+        results: List[Dict[str, Any]],
+        query_embedding: Optional[np.ndarray],
+    ) -> Optional[np.ndarray]:
+        """
+        Embeds result bodies as unit float32 rows for ranking semantic cache hits.
+
+        Args:
+            results: Search results to embed.
+            query_embedding: The query's embedding; bodies are only embedded when
+                the query was, since only semantic cache hits are ranked.
+
+        Returns:
+            An (n, d) float32 matrix, or None if embedding is unavailable.
+        """
+        if query_embedding is None or not results:
+            return None
+        try:
+            embeddings = np.asarray(
+                await vector_store.embed_batch(
+                    [r["body"] or r["title"] or "" for r in results],
+                    input_type="passage",
+                ),
+                dtype=np.float32,
+            )
+        except Exception as e:
+            logger.warning(f"Skipping web search result embeddings: {str(e)}")
+            return None
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.where(norms == 0.0, 1.0, norms)
 
     def clear_cache(self):
         """Clears the search cache."""
-        self.cache = {}
+        self.cache.clear()
+        self.semantic_cache.clear()
         logger.info("Web search cache cleared.")
 
 
@@ -3,8 +3,12 @@ Warning suppression module for LangChain deprecation warnings
 This module must be imported before any other modules to suppress warnings
 """
 
+import re
 import warnings
 
+_LANGCHAIN_RE = re.compile("langchain", re.IGNORECASE)
+_LANGCHAIN_CATEGORY = "LangChainDeprecationWarning"
+
 
 # Set up a custom warning filter that catches LangChain deprecation warnings
 class LangChainWarningFilter:
@@ -14,10 +18,10 @@ class LangChainWarningFilter:
     def __call__(self, message, category, filename, lineno, file=None, line=None):
         # Check if this is a LangChain deprecation warning
         if (
-            isinstance(category, DeprecationWarning)
-            and "langchain" in str(message).lower()
-            or "LangChainDeprecationWarning" in str(category)
-            or "langchain" in filename.lower()
+            _LANGCHAIN_CATEGORY in category.__name__
+            or _LANGCHAIN_RE.search(filename)
+            or issubclass(category, DeprecationWarning)
+            and _LANGCHAIN_RE.search(str(message))
         ):
             return  # Suppress this warning
         # Otherwise, show the warning normally
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Backend modules import each other from the be/ root (e.g. "from core.config import settings")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,47 @@
+import asyncio
+
+import httpx
+import pytest
+
+from services.nemo_llm_service import _extract_response, _iter_ndjson_lines
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        (b'{"model":"m","response":"Hello","done":false}', "Hello"),
+        (b'{"model":"m","response":"","done":false}', ""),
+        (b'{"model":"m","response":"say \\"hi\\"","done":false}', 'say "hi"'),
+        (b'{"model":"m","response":"a\\\\","done":false}', "a\\"),
+        (b'{"model":"m","response":"line\\nbreak","done":false}', "line\nbreak"),
+        (b'{"model":"m","response":"caf\\u00e9","done":false}', "café"),
+        ('{"model":"m","response":"café","done":false}'.encode(), "café"),
+        (b'{"model":"m","response":"","done":true,"context":[1,2]}', ""),
+        (b'{"model":"m","done":false}', None),
+    ],
+)
+def test_extract_response(line, expected):
+    assert _extract_response(line) == expected
+
+
+def test_extract_response_drops_malformed_lines():
+    assert _extract_response(b'{"response":"unterminated') is None
+
+
+def test_iter_ndjson_lines_rejoins_lines_split_across_chunks():
+    chunks = [b'{"response":"a"}\n{"resp', b'onse":"b"}\n\n', b'{"response":"c"}']
+
+    async def collect():
+        response = httpx.Response(200, content=_stream(chunks))
+        return [line async for line in _iter_ndjson_lines(response)]
+
+    assert asyncio.run(collect()) == [
+        b'{"response":"a"}',
+        b'{"response":"b"}',
+        b'{"response":"c"}',
+    ]
+
+
+async def _stream(chunks):
+    for chunk in chunks:
+        yield chunk
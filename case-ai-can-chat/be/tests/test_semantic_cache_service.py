@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+from services import semantic_cache_service
+from services.semantic_cache_service import SemanticCacheService, quantize_int8
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+@pytest.fixture
+def embedding():
+    return _unit(np.random.default_rng(1).standard_normal(64))
+
+
+def _cache(**kwargs):
+    options = dict(
+        similarity_threshold=0.95,
+        ttl_seconds=60.0,
+        max_entries=8,
+        num_bits=8,
+        dtype="float32",
+        enabled=True,
+    )
+    options.update(kwargs)
+    return SemanticCacheService(**options)
+
+
+def test_near_duplicate_hits_and_distant_query_misses(embedding):
+    cache = _cache()
+    cache.store(embedding, "answer")
+
+    noise = np.random.default_rng(2).standard_normal(64) * 0.01
+    value, similarity = cache.lookup(_unit(embedding + noise))
+    assert value == "answer"
+    assert similarity >= 0.95
+
+    assert cache.lookup(-embedding) is None
+    assert cache.get_stats()["hits"] == 1
+    assert cache.get_stats()["misses"] == 1
+
+
+def test_entries_only_match_their_scope(embedding):
+    cache = _cache()
+    cache.store(embedding, "user 1", scope=(1,))
+
+    assert cache.lookup(embedding, scope=(2,)) is None
+    assert cache.lookup(embedding, scope=(1,))[0] == "user 1"
+
+
+def test_expired_entries_are_dropped(embedding, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(semantic_cache_service.time, "monotonic", lambda: now[0])
+    cache = _cache(ttl_seconds=10.0)
+    cache.store(embedding, "answer")
+
+    now[0] += 9.0
+    assert cache.lookup(embedding) is not None
+    now[0] += 2.0
+    assert cache.lookup(embedding) is None
+    assert cache.get_stats()["entries"] == 0
+
+
+def test_oldest_entry_is_evicted_over_the_limit():
+    cache = _cache(max_entries=2)
+    vectors = [_unit(np.eye(64)[i] + 0.01) for i in range(3)]
+    for i, vector in enumerate(vectors):
+        cache.store(vector, i)
+
+    assert cache.lookup(vectors[0]) is None
+    assert cache.lookup(vectors[1])[0] == 1
+    assert cache.lookup(vectors[2])[0] == 2
+    assert cache.get_stats()["entries"] == 2
+
+
+def test_disabled_cache_stores_nothing(embedding):
+    cache = _cache(enabled=False)
+    cache.store(embedding, "answer")
+
+    assert cache.lookup(embedding) is None
+    assert cache.get_stats()["entries"] == 0
+
+
+def test_int8_entries_match_like_float32(embedding):
+    cache = _cache(dtype="int8")
+    cache.store(embedding, "answer")
+
+    value, similarity = cache.lookup(embedding)
+    assert value == "answer"
+    assert similarity == pytest.approx(1.0, abs=0.01)
+
+
+def test_quantize_int8_scales_each_row():
+    matrix = np.array([[0.5, -1.0, 0.25], [0.0, 0.0, 0.0]], dtype=np.float32)
+    quantized, scales = quantize_int8(matrix)
+
+    assert quantized.dtype == np.int8
+    assert quantized[0].tolist() == [64, -127, 32]
+    assert quantized[1].tolist() == [0, 0, 0]
+    np.testing.assert_allclose(quantized[0] * scales[0], matrix[0], atol=0.01)
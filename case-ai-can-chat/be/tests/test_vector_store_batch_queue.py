@@ -0,0 +1,63 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+pytest.importorskip("chromadb")
+
+from services.vector_store import _BatchQueue  # noqa: E402
+
+
+def _run(queue_kwargs, texts, embed_batch):
+    async def main():
+        queue = _BatchQueue(embed_batch, **queue_kwargs)
+        return await asyncio.gather(
+            *[queue.submit(text) for text in texts], return_exceptions=True
+        )
+
+    return asyncio.run(main())
+
+
+def test_concurrent_submits_share_one_batch():
+    calls = []
+
+    async def embed_batch(texts):
+        calls.append(list(texts))
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+    results = _run(dict(window_ms=5.0, max_batch=32), ["a", "bb", "ccc"], embed_batch)
+
+    assert calls == [["a", "bb", "ccc"]]
+    assert [r.tolist() for r in results] == [[1.0, 1.0], [2.0, 1.0], [3.0, 1.0]]
+    # Callers own their rows rather than views into the batch array
+    assert all(r.base is None for r in results)
+
+
+def test_full_batch_is_flushed_without_waiting_for_the_window():
+    calls = []
+
+    async def embed_batch(texts):
+        calls.append(list(texts))
+        return np.zeros((len(texts), 2), dtype=np.float32)
+
+    _run(dict(window_ms=10_000.0, max_batch=2), ["a", "b", "c", "d"], embed_batch)
+
+    assert calls == [["a", "b"], ["c", "d"]]
+
+
+def test_batch_failure_is_raised_to_every_caller():
+    async def embed_batch(texts):
+        raise RuntimeError("NIM unavailable")
+
+    results = _run(dict(window_ms=1.0, max_batch=32), ["a", "b"], embed_batch)
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_short_batch_response_is_an_error():
+    async def embed_batch(texts):
+        return np.zeros((1, 2), dtype=np.float32)
+
+    results = _run(dict(window_ms=1.0, max_batch=32), ["a", "b"], embed_batch)
+
+    assert all(isinstance(r, RuntimeError) for r in results)
@@ -42,6 +42,7 @@ const getStepIcon = (stepType: string) => {
     searching: Database,
     retrieved: FileText,
     analyzing_document: FileText,
+    analyzing_documents: FileText,
     reranking: ArrowUpDown,
     generating: Sparkles,
     suggestions: Lightbulb,
@@ -189,6 +189,7 @@ export default function Home() {
                 }
                 break;
 
+              case 'token':
               case 'content':
                 // Mark that content has started (for CoT collapse)
                 if (!msg.hasStartedContent && chunk.data) {
@@ -197,6 +198,11 @@ export default function Home() {
                 msg.content += chunk.data;
                 break;
 
+              case 'replace':
+                // Final response differs from the streamed tokens (e.g. blocked by guardrails)
+                msg.content = chunk.data;
+                break;
+
               case 'sources':
                 msg.sources = chunk.data;
                 break;
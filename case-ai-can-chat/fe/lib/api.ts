@@ -38,7 +38,7 @@ export interface ChainOfThoughtStep {
 }
 
 export interface StreamChunk {
-  type: 'cot_step' | 'content' | 'sources' | 'suggestions' | 'done' | 'error';
+  type: 'cot_step' | 'token' | 'content' | 'replace' | 'sources' | 'suggestions' | 'done' | 'error';
   data?: any;
 }
 